@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Finds which parts of the levels the player can reach from the saved game,
+# following orbs from level to level, and reports orbs and checkpoints that
+# can't be reached. Navigation graphs are cached in levels/level*_nav.txt.
+# The player's speed, jump and gravity are whole pixels worked out from
+# TILE_SIZE, which the game sets from the screen height (a 16th of 4/5 of
+# it), so what's reachable can change with the resolution. The results are
+# only for the tile size given with --tile-size, by default the headless
+# display's (38 px). Common screens: 1366x768 plays at 38 px, 1920x1080 at
+# 54 px and 2560x1440 at 72 px.
+# Usage:
+#   python analyze_levels.py
+#   python analyze_levels.py --json
+#   python analyze_levels.py --tile-size 54   # as played at 1920x1080
+#   python analyze_levels.py --path 0,5,140,32,141   # moves from cell (5,140) to (32,141) in level 0
+
+import sys
+import json
+import argparse
+
+sys.path.append('scripts')
+from globals import init_display
+
+def analyze(graphs, save_data, tile_data):
+    ''' Find the nodes reachable in each level, starting where save_data puts
+        the player and entering a level wherever an orb of its colour is touched
+    args:
+        graphs: dict of level name -> Nav_graph
+    returns:
+        dict of level name -> report dict
+    '''
+    reached = {name: set() for name in graphs} # level -> reachable nodes
+    entries = [(str(save_data['level']), save_data['player_loc'])]
+    if save_data['checkpoint']: entries.append((str(save_data['level']), save_data['checkpoint']))
+    while entries:
+        name, (px, py) = entries.pop()
+        if name not in graphs: continue
+        graph = graphs[name]
+        start = graph.drop(px, py)
+        if start == None or start in reached[name]: continue
+        new = graph.reachable([start]) - reached[name]
+        reached[name] |= new
+        for x, y in graph.touched(new):
+            tile = graph.items[(x, y)]
+            if tile in navigation.ORB_TILES: # the player arrives in the orb's level where it touched it
+                entries.append((str(tile_data[str(tile)]['color']), (x * TILE_SIZE, y * TILE_SIZE)))
+
+    reports = {}
+    for name, graph in graphs.items():
+        touched = graph.touched(reached[name])
+        unreachable = [cell for cell in sorted(graph.items) if cell not in touched]
+        reports[name] = {
+            'entered': len(reached[name]) > 0,
+            'nodes': len(graph.nodes),
+            'edges': sum(len(edges) for edges in graph.edges),
+            'reachable_nodes': len(reached[name]),
+            'unreachable_orbs': [[x, y, tile_data[str(graph.items[(x, y)])]['color']] \
+                for x, y in unreachable if graph.items[(x, y)] in navigation.ORB_TILES],
+            'unreachable_checkpoints': [[x, y] for x, y in unreachable \
+                if graph.items[(x, y)] == navigation.CHECKPOINT_TILE],
+        }
+    return reports
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report unreachable orbs and checkpoints')
+    parser.add_argument('--tile-size', type=int, help='tile size in pixels to simulate the moves at')
+    parser.add_argument('--save', default='save_data', help='save file to start from (without .txt)')
+    parser.add_argument('--no-cache', action='store_true', help="rebuild the graphs and don't cache them")
+    parser.add_argument('--path', help='print the moves between two cells, as "level,x0,y0,x1,y1"')
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args()
+
+    init_display(headless=True, tile_size=args.tile_size)
+    import file_handling
+    import navigation
+    from globals import TILE_SIZE
+
+    tile_data = file_handling.load_json('tile_data')
+    graphs = {name: navigation.load_graph(name, tile_data, not args.no_cache) for name in file_handling.level_names()}
+
+    if args.path:
+        name, x0, y0, x1, y1 = args.path.split(',')
+        graph = graphs[name]
+        start, goal = graph.index.get((int(x0), int(y0))), graph.index.get((int(x1), int(y1)))
+        if start == None or goal == None:
+            print("ERROR: both cells must be ones the player can stand in")
+            sys.exit(1)
+        steps = graph.path(start, goal)
+        if steps == None: print('no path')
+        else:
+            for end, kind, frames, move in steps:
+                print(f'{kind:5} to {graph.nodes[end]} in {frames} frames with {move}')
+        sys.exit()
+
+    reports = analyze(graphs, file_handling.load_json(args.save), tile_data)
+    if args.json:
+        print(json.dumps({'tile_size': TILE_SIZE, 'levels': reports}))
+    else:
+        print(f'tile size {TILE_SIZE} px')
+        for name, report in reports.items():
+            print(f"level {name}: {report['reachable_nodes']}/{report['nodes']} standable cells reachable, " \
+                f"{report['edges']} moves" + ('' if report['entered'] else ', never entered'))
+            for x, y, color in report['unreachable_orbs']:
+                print(f"  unreachable orb (colour {color}) at cell ({x}, {y})")
+            for x, y in report['unreachable_checkpoints']:
+                print(f"  unreachable checkpoint at cell ({x}, {y})")
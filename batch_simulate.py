@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+#
+# Playtesting at scale: runs many headless simulations with random input on a
+# pool of processes and reports runs where the player got soft-locked, escaped
+# out of bounds or kept dying right after respawning. Runs start where the save
+# puts the player, at each checkpoint and wherever an orb brings the player into
+# a level. Deaths respawn the player where the save says, as in the game.
+# Each worker loads the assets and levels once and reuses them.
+# Usage:
+#   python batch_simulate.py --runs 1000
+#   python batch_simulate.py --runs 200 --levels 0,2 --frames 7200 --workers 4
+#   python batch_simulate.py --runs 500 --results runs.txt   # one json line per run
+#   python batch_simulate.py --runs 500 --record failed      # recordings of the runs that failed
+# Failed runs can be replayed with: python simulate.py --replay failed/run12.rec
+
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import multiprocessing
+
+sys.path.append('scripts')
+import file_handling
+
+SOFT_LOCK_FRAMES = 1800 # frames the player has to stay in a small area to be soft-locked
+SOFT_LOCK_TILES = 3 # size (in tiles) of that area
+DEATH_LOOP_FRAMES = 20 # dying this many frames or less after respawning...
+DEATH_LOOP_COUNT = 3 # ...this many times in a row is a death loop
+
+# outcomes of a run
+OK = 'ok'
+SOFT_LOCK = 'soft-lock'
+OUT_OF_BOUNDS = 'out-of-bounds'
+DEATH_LOOP = 'death-loop'
+ERROR = 'error'
+OUTCOMES = (OK, SOFT_LOCK, OUT_OF_BOUNDS, DEATH_LOOP, ERROR)
+
+# a run's result is a tuple of these, kept small since every run sends one back
+RESULT_FIELDS = ('run', 'start_level', 'start_cell', 'seed', 'outcome', 'frames', 'x', 'y', 'level', 'deaths')
+
+## WORKER ##
+# these run in the pool's processes, main is imported by init_worker
+
+def init_worker(save_json, record_dir):
+    ''' Load the game once per worker process '''
+    global main, inputs, level_loader, save_text, record_to
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1' # SDL would catch the pool's SIGTERM
+    import main # loads assets
+    import inputs
+    import level_loader
+    main.loader.read = functools.lru_cache(maxsize=None)(level_loader.read_level) # read each level once
+    save_text = save_json
+    record_to = record_dir
+
+def out_of_bounds(rect):
+    ''' True if rect touches the edge of the map, where only keep_in_bounds 
+        stops the player instead of the level's walls and floor '''
+    return rect.left <= 0 or rect.top <= 0 or rect.right >= main.MAX_COLS * main.TILE_SIZE \
+        or rect.bottom >= main.MAX_ROWS * main.TILE_SIZE
+
+def play(keys, data, start, frames):
+    ''' Run the world until frames frames pass or something goes wrong
+    args:
+        start: (level, x, y) to start the player at, None for the saved 
+            position. Deaths still respawn the player where data says
+    returns:
+        (outcome, frames run)
+    '''
+    main.start_game(data, start)
+    area = main.player.rect.copy() # where the player has been since area_start
+    area_start = 0
+    level, deaths = main.level, 0
+    inside = not out_of_bounds(main.player.rect) # saved positions can be outside at other tile sizes
+    respawned = 0 # frame of the last respawn
+    quick_deaths = 0 # deaths in a row soon after respawning
+    for frame in range(1, frames + 1):
+        main.update_world(keys)
+        rect = main.player.rect
+        moved = main.level != level # player was moved, by dying or changing level
+        level = main.level
+        if main.deaths != deaths:
+            deaths = main.deaths
+            quick_deaths = quick_deaths + 1 if frame - respawned <= DEATH_LOOP_FRAMES else 1
+            if quick_deaths >= DEATH_LOOP_COUNT: return DEATH_LOOP, frame
+            respawned = frame
+            moved = True
+            inside = not out_of_bounds(rect) # like the start, the save's position can be outside
+        elif out_of_bounds(rect):
+            if inside: return OUT_OF_BOUNDS, frame
+        else: inside = True
+        if moved: area, area_start = rect.copy(), frame
+        else: area.union_ip(rect)
+        size = SOFT_LOCK_TILES * main.TILE_SIZE
+        if frame - area_start >= SOFT_LOCK_FRAMES:
+            if area.w <= size and area.h <= size:
+                return SOFT_LOCK, frame
+            area, area_start = rect.copy(), frame
+    return OK, frames
+
+def run(task):
+    ''' Play one run with random input
+    args:
+        task: (run number, level to start in, cell to start in or None for
+            the save's position, seed, frames)
+    returns:
+        result tuple, see RESULT_FIELDS
+    '''
+    number, lvl, cell, seed, frames = task
+    data = json.loads(save_text)
+    start = (lvl, cell[0] * main.TILE_SIZE, cell[1] * main.TILE_SIZE) if cell != None else None
+    keys = inputs.Random_input(seed)
+    path = os.path.join(record_to, f'run{number}.rec') if record_to else None
+    if path: keys = inputs.Recorder(keys, path, data, start=start)
+    try:
+        outcome, played = play(keys, data, start, frames)
+    except Exception as exc:
+        print(f"ERROR: run {number} failed.", exc)
+        outcome, played = ERROR, main.frame
+    if path:
+        keys.close()
+        if outcome == OK: os.remove(path)
+    return (number, lvl, cell, seed, outcome, played, main.player.rect.x, main.player.rect.y, main.level, main.deaths)
+
+## REPORT ##
+
+def start_points(save_data, tile_data):
+    ''' List of (level, cell) to start runs from: the save's position (cell 
+        None), the checkpoints and, in the level of each orb's colour, the 
+        orb's cell, since collecting it takes the player there '''
+    points = [(save_data['level'], None)]
+    for name in file_handling.level_names():
+        for y, row in enumerate(file_handling.load_level(name)):
+            for x, tile in enumerate(row):
+                if tile in range(1, 8): points.append((tile_data[str(tile)]['color'], (x, y)))
+                elif tile == 8: points.append((int(name), (x, y)))
+    return points
+
+def summarize(results, seconds, workers):
+    ''' Summary dict of a list of result tuples '''
+    frames = sum(r[5] for r in results)
+    summary = {
+        'runs': len(results),
+        'frames': frames,
+        'seconds': seconds,
+        'workers': workers,
+        'steps_per_sec': frames / seconds if seconds else float('inf'),
+        'outcomes': {outcome: 0 for outcome in OUTCOMES},
+        'levels': {}, # start level -> outcome counts and levels reached
+        'failed': [dict(zip(RESULT_FIELDS, r)) for r in sorted(results) if r[4] != OK],
+    }
+    for r in results:
+        summary['outcomes'][r[4]] += 1
+        stats = summary['levels'].setdefault(str(r[1]), \
+            {'runs': 0, 'outcomes': {outcome: 0 for outcome in OUTCOMES}, 'reached': {}})
+        stats['runs'] += 1
+        stats['outcomes'][r[4]] += 1
+        stats['reached'][str(r[8])] = stats['reached'].get(str(r[8]), 0) + 1
+    return summary
+
+def print_summary(summary):
+    print(f"{summary['runs']} runs, {summary['frames']} frames in {summary['seconds']:.1f}s " \
+        f"on {summary['workers']} workers ({summary['steps_per_sec']:.0f} steps/s)")
+    print('  ' + '  '.join(f'{outcome}: {n}' for outcome, n in summary['outcomes'].items()))
+    for lvl, stats in sorted(summary['levels'].items(), key=lambda item: int(item[0])):
+        failed = ', '.join(f'{n} {outcome}' for outcome, n in stats['outcomes'].items() if n and outcome != OK)
+        reached = ', '.join(f'{n} in {l}' for l, n in sorted(stats['reached'].items(), key=lambda item: int(item[0])))
+        print(f"level {lvl}: {stats['runs']} runs, {failed or 'no failures'}; ended {reached}")
+    for r in summary['failed']:
+        start = f"cell {tuple(r['start_cell'])}" if r['start_cell'] else 'saved position'
+        print(f"  run {r['run']} (level {r['start_level']} {start}, seed {r['seed']}): {r['outcome']} " \
+            f"at frame {r['frames']}, player at {r['x']},{r['y']} in level {r['level']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run many headless playtests in parallel')
+    parser.add_argument('--runs', type=int, default=100, help='number of runs')
+    parser.add_argument('--frames', type=int, default=3600, help='frames per run')
+    parser.add_argument('--levels', help='only start in these levels, like "0,2"')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run, each run adds one')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--save', default='save_data', help='save file to start from (without .txt)')
+    parser.add_argument('--results', help='file to write every result to, one json line per run')
+    parser.add_argument('--record', help='folder to keep recordings of the failed runs in')
+    parser.add_argument('--json', action='store_true', help='print the summary as json')
+    args = parser.parse_args()
+
+    save_data = file_handling.load_json(args.save)
+    points = start_points(save_data, file_handling.load_json('tile_data'))
+    if args.levels: points = [p for p in points if str(p[0]) in args.levels.split(',')]
+    if not points:
+        print("ERROR: nowhere to start in those levels")
+        sys.exit(1)
+    if args.record: os.makedirs(args.record, exist_ok=True)
+    tasks = [(i, *points[i % len(points)], args.seed + i, args.frames) for i in range(args.runs)]
+
+    results = []
+    results_file = open(args.results, 'w') if args.results else None
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers, init_worker, (json.dumps(save_data), args.record)) as pool:
+        # small chunks keep every worker busy until the end, results arrive as runs finish
+        for result in pool.imap_unordered(run, tasks, chunksize=max(1, args.runs // (args.workers * 8))):
+            results.append(result)
+            if results_file: results_file.write(json.dumps(dict(zip(RESULT_FIELDS, result))) + '\n')
+        pool.close()
+        pool.join()
+    seconds = time.perf_counter() - start
+    if results_file: results_file.close()
+
+    summary = summarize(results, seconds, args.workers)
+    if args.json: print(json.dumps(summary))
+    else: print_summary(summary)
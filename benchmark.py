@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+#
+# Benchmarks for the game's per-frame and loading paths over every level in
+# levels/, run offscreen. Usage:
+#   python benchmark.py                  # run and compare to bench_baseline.txt
+#   python benchmark.py --save-baseline  # run and store results as the baseline
+#   python benchmark.py --output results.json
+
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+from time import perf_counter
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+import main # loads assets and the saved game
+import file_handling
+import physics_obj
+import render
+import inputs
+from globals import TILE_SIZE, MAX_ROWS, MAX_COLS, SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, RAINBOW
+
+BASELINE = 'bench_baseline' # json file of baseline results (without .txt)
+TOLERANCE = 0.25 # flag a regression when the median is this much slower than baseline
+
+def scroll_positions(n, seed=0):
+    ''' n random camera positions inside the level '''
+    rand = random.Random(seed)
+    return [(rand.randint(0, MAX_COLS*TILE_SIZE - SCREEN_WIDTH), \
+        rand.randint(0, MAX_ROWS*TILE_SIZE - SCREEN_HEIGHT)) for _ in range(n)]
+
+def timeit(func, repeat, setup=None):
+    ''' Time repeat calls of func, calling setup (untimed) before each
+    returns:
+        dict of timing stats in milliseconds
+    '''
+    times = []
+    for i in range(repeat):
+        if setup != None: setup(i)
+        start = perf_counter()
+        func()
+        times.append((perf_counter() - start) * 1000)
+    times.sort()
+    mean = statistics.fmean(times)
+    return {
+        'mean_ms': mean,
+        'p50_ms': times[len(times)//2],
+        'p99_ms': times[min(len(times)-1, int(len(times)*0.99))],
+        'ops_per_sec': 1000 / mean if mean else float('inf'),
+        'runs': repeat,
+    }
+
+def bench_level(lvl, repeat):
+    ''' Benchmark the game's paths on one level, returns dict of name -> stats '''
+    results = {}
+    main.start_game(file_handling.load_json('save_data'))
+    main.load_level(int(lvl))
+    scrolls = scroll_positions(repeat)
+
+    def set_scroll(i):
+        main.scroll_x, main.scroll_y = scrolls[i]
+
+    if os.path.exists(f'levels/level{lvl}_data'):
+        results['load_pickle'] = timeit(lambda: file_handling.load_pickle(lvl), repeat)
+    results['load_level'] = timeit(lambda: file_handling.load_level(lvl), repeat)
+    results['create_room_objects'] = timeit(lambda: main.create_room_objects(main.world_data, main.level), repeat)
+    def draw_tiles():
+        main.draw_tiles(main.scroll_x, main.scroll_y)
+        main.render_queue.flush()
+    results['draw_tiles'] = timeit(draw_tiles, repeat, set_scroll)
+    tile_rows = render.Tile_rows(main.world_data, main.tile_images(main.level), TILE_SIZE)
+    def draw_tiles_unchunked():
+        tile_rows.draw(main.render_queue, main.scroll_x, main.scroll_y)
+        main.render_queue.flush()
+    results['draw_tiles_unchunked'] = timeit(draw_tiles_unchunked, repeat, set_scroll)
+
+    def entities():
+        main.frame += 1
+        main.update_entities()
+        for ob in main.entities.query(main.camera_rect()):
+            ob.draw(main.screen, main.scroll_x, main.scroll_y)
+    results['entities'] = timeit(entities, repeat, set_scroll)
+
+    keys = inputs.Random_input(0)
+    player = main.player
+    results['player_update'] = timeit(lambda: player.update(main.tiles, keys.get_pressed()), repeat)
+
+    rect = pygame.Rect(0, 0, TILE_SIZE, TILE_SIZE)
+    def set_rect(i):
+        rect.x, rect.y = scrolls[i][0] + SCREEN_WIDTH//2, scrolls[i][1] + SCREEN_HEIGHT//2
+    results['collision_test'] = timeit(lambda: physics_obj.collision_test(rect, main.tiles), repeat, set_rect)
+    return results
+
+def bench_replace_pixels(repeat):
+    ''' Benchmark recoloring the orb sheet, bypassing the recolor cache '''
+    return timeit(lambda: physics_obj.replace_pixels(main.orb_img, RAINBOW[0], WHITE), repeat, \
+        lambda i: physics_obj.recolor_cache.clear())
+
+def bench_editor(levels, repeat):
+    ''' Benchmark the level editor's draw_world and draw_grid on each level '''
+    import level_editor # opens the editor's (offscreen) window, level files are only touched when it runs
+    results = {}
+    rand = random.Random(0)
+    max_x = level_editor.MAX_COLS*level_editor.TILE_SIZE - level_editor.SCREEN_WIDTH
+    max_y = level_editor.MAX_ROWS*level_editor.TILE_SIZE - level_editor.SCREEN_HEIGHT
+    scrolls = [(rand.randint(0, max_x), rand.randint(0, max_y)) for _ in range(repeat)]
+
+    def set_scroll(i):
+        level_editor.scroll_x, level_editor.scroll_y = scrolls[i]
+
+    def frame():
+        level_editor.draw_world()
+        level_editor.draw_grid()
+
+    for lvl in levels:
+        level_editor.world_data = file_handling.load_level(lvl, copy=True)
+        results[f'level{lvl}/editor_draw'] = timeit(frame, repeat, set_scroll)
+        results[f'level{lvl}/editor_draw_still'] = timeit(frame, repeat) # view not scrolling
+    return results
+
+def run(repeat):
+    ''' Run every benchmark, returns dict of name -> stats '''
+    levels = file_handling.level_names()
+    results = {}
+    for lvl in levels:
+        for name, stats in bench_level(lvl, repeat).items():
+            results[f'level{lvl}/{name}'] = stats
+    results['replace_pixels'] = bench_replace_pixels(repeat)
+    results.update(bench_editor(levels, repeat))
+    return results
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    ''' Return list of (name, baseline p50, p50) that got slower than tolerance '''
+    regressions = []
+    for name, stats in results.items():
+        if name in baseline:
+            old = baseline[name]['p50_ms']
+            if stats['p50_ms'] > old * (1 + tolerance):
+                regressions.append((name, old, stats['p50_ms']))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the game offscreen')
+    parser.add_argument('--repeat', type=int, default=200, help='runs of each benchmark')
+    parser.add_argument('--output', help='file to write results to as json')
+    parser.add_argument('--save-baseline', action='store_true', help=f'store results in {BASELINE}.txt')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown vs baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    for name, stats in results.items():
+        print(f"{name:40} mean {stats['mean_ms']:8.3f}ms  p50 {stats['p50_ms']:8.3f}ms  " \
+            f"p99 {stats['p99_ms']:8.3f}ms  {stats['ops_per_sec']:10.1f} ops/s")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    if args.save_baseline:
+        file_handling.save_json(BASELINE, results)
+    elif os.path.exists(BASELINE + '.txt'):
+        regressions = compare(results, file_handling.load_json(BASELINE), args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION: {name} {old:.3f}ms -> {new:.3f}ms")
+        if regressions: sys.exit(1)
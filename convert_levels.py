@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+#
+# Convert the legacy pickled levels (levels/levelN_data) to binary level 
+# files (levels/levelN.lvl). The pickles are left in place.
+
+import os
+import sys
+import glob
+sys.path.append('scripts')
+import file_handling
+
+if __name__ == '__main__':
+    for path in sorted(glob.glob('levels/level*_data')):
+        name = os.path.basename(path)[len('level'):-len('_data')]
+        world_data = file_handling.load_pickle(name)
+        file_handling.save_level(name, world_data)
+        assert [list(row) for row in file_handling.load_level(name)] == world_data
+        print(f"{path} ({os.path.getsize(path)} bytes) -> {file_handling.level_path(name)} " \
+            f"({os.path.getsize(file_handling.level_path(name))} bytes)")
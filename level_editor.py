@@ -1,6 +1,11 @@
 ## LOAD MODULES ## 
+import sys
 import pygame
-import pickle
+sys.path.append('scripts')
+import file_handling
+import render
+import edit_journal
+import autosave
 
 pygame.init()
 
@@ -48,6 +53,13 @@ scroll_down = False
 scroll_x = 0
 scroll_y = (MAX_ROWS * TILE_SIZE) - SCREEN_HEIGHT
 scroll_speed = 1
+tool = 'brush'
+drag_start = None #cell where the mouse was pressed, for the rect and copy tools
+drag_button = 1
+clipboard = None #region copied with the copy tool
+
+#tool keys
+TOOLS = {pygame.K_b: 'brush', pygame.K_r: 'rect', pygame.K_f: 'fill', pygame.K_c: 'copy', pygame.K_v: 'paste'}
 
 #define font
 font = pygame.font.SysFont('Futura', 16)
@@ -69,47 +81,87 @@ for row in range(MAX_ROWS):
 	r = [-1] * MAX_COLS
 	world_data.append(r)
 
+#cached surface of the tiles in view with the grid lines drawn over them
+grid_overlay = render.Grid_overlay((SCREEN_WIDTH, SCREEN_HEIGHT + 1), TILE_SIZE, WHITE)
+world_layer = render.Tile_layer((SCREEN_WIDTH, SCREEN_HEIGHT + 1), img_list, TILE_SIZE, grid_overlay)
+text_cache = {} #(text, font, colour) -> rendered text
+panel_queue = render.Render_queue(screen) #text and buttons, drawn with one blits call
+
+#set up when the editor runs, so importing it (eg. to benchmark) doesn't touch the level files
+autosaver = None
+
+#called by the journal after cells x to x+n-1 of row y change
+def cells_changed(x, y, n):
+	world_layer.set_tiles(x, y, n)
+	if autosaver != None:
+		autosaver.changed(x, y, n)
+
+#undo/redo history, edits go through it
+journal = edit_journal.Edit_journal(world_data, cells_changed)
+
 
 ## HELPER FUNCTIONS ##
 
-#function for outputting text onto the screen
+#function for outputting text onto the screen, each text is only rendered once
+#it's queued and drawn with the buttons by panel_queue.flush()
 def blit_text(text, font, text_col, x, y):
-	img = font.render(text, True, text_col)
-	screen.blit(img, (x, y))
+	key = (text, font, text_col)
+	if key not in text_cache:
+		text_cache[key] = font.render(text, True, text_col)
+	panel_queue.blit(text_cache[key], (x, y))
 
 #create function for drawing background
 def draw_bg():
 	screen.fill(RAINBOW[level_loaded], [0, 0, SCREEN_WIDTH, SCREEN_HEIGHT])
 
 #draw grid
+#the grid lines are cached with the world tiles, see draw_world
 def draw_grid():
-	#vertical lines
-	for c in range(MAX_COLS + 1):
-		pygame.draw.line(screen, WHITE, (c * TILE_SIZE - scroll_x, 0), (c * TILE_SIZE - scroll_x, SCREEN_HEIGHT))
-	#horizontal lines
-	for c in range(MAX_ROWS + 1):
-		pygame.draw.line(screen, WHITE, (0, c * TILE_SIZE - scroll_y), (SCREEN_WIDTH, c * TILE_SIZE - scroll_y))
 	screen.fill(GREY, (SCREEN_WIDTH, 0, SIDE_MARGIN, SCREEN_HEIGHT + LOWER_MARGIN)) #side panel for tiles
 	screen.fill(GREY, [0, SCREEN_HEIGHT+1, SCREEN_WIDTH, SCREEN_HEIGHT + LOWER_MARGIN]) #botton panel for save and load 
 
-#function for drawing the world tiles
+#function for drawing the world tiles, only the tiles in view are drawn 
+#and they're cached until the map scrolls
 def draw_world():
-	for y, row in enumerate(world_data):
-		for x, tile in enumerate(row):
-			if tile >= 0:
-				screen.blit(img_list[tile], (x * TILE_SIZE - scroll_x, y * TILE_SIZE - scroll_y))
+	world_layer.draw(screen, world_data, int(scroll_x), int(scroll_y))
+
+#function for getting the cell under a screen position, None if it's not on the map
+def get_cell(pos):
+	if pos[0] < SCREEN_WIDTH and pos[1] < SCREEN_HEIGHT:
+		return int((pos[0] + scroll_x) // TILE_SIZE), int((pos[1] + scroll_y) // TILE_SIZE)
+	return None
+
+#function for outlining the cells a tool will change
+def draw_selection():
+	cell = get_cell(pygame.mouse.get_pos())
+	if cell == None:
+		return
+	if drag_start != None:
+		x0, y0 = min(drag_start[0], cell[0]), min(drag_start[1], cell[1])
+		x1, y1 = max(drag_start[0], cell[0]), max(drag_start[1], cell[1])
+	elif tool == 'paste' and clipboard != None:
+		x0, y0 = cell
+		x1, y1 = x0 + len(clipboard[0]) - 1, y0 + len(clipboard) - 1
+	else:
+		return
+	rect = (x0 * TILE_SIZE - scroll_x, y0 * TILE_SIZE - scroll_y, (x1 - x0 + 1) * TILE_SIZE, (y1 - y0 + 1) * TILE_SIZE)
+	pygame.draw.rect(screen, RED, rect, 3)
 
 #function for drawing text on screen
 def draw_text():
+	blit_text(f'Tool: {tool} (B brush, R rect, F fill, C copy, V paste, CTRL+Z undo, CTRL+Y redo)', font, WHITE, 10, SCREEN_HEIGHT + 22)
 	blit_text(f'Selected Level: {level}', font, WHITE, 10, SCREEN_HEIGHT + LOWER_MARGIN - 60)
 	blit_text('Press UP or DOWN to change selected level', font, WHITE, 10, SCREEN_HEIGHT + LOWER_MARGIN - 30)
-	for c in range(MAX_COLS + 1):
+	#only look at the rows and columns in view
+	first = int(scroll_x) // TILE_SIZE
+	for c in range(first - first % 5, min(MAX_COLS, first + SCREEN_WIDTH // TILE_SIZE + 1) + 1, 5):
 		loc = c * TILE_SIZE - scroll_x
-		if c % 5 == 0 and loc > 0 and loc < SCREEN_WIDTH:
+		if loc > 0 and loc < SCREEN_WIDTH:
 			blit_text(str(c), coord_font, WHITE, loc + 10, SCREEN_HEIGHT + 5)
-	for c in range(MAX_ROWS + 1):
+	first = int(scroll_y) // TILE_SIZE
+	for c in range(first - first % 5, min(MAX_ROWS, first + SCREEN_HEIGHT // TILE_SIZE + 1) + 1, 5):
 		loc = c * TILE_SIZE - scroll_y
-		if c % 5 == 0 and loc > 0 and loc < SCREEN_HEIGHT + 10:
+		if loc > 0 and loc < SCREEN_HEIGHT + 10:
 			blit_text(str(c), coord_font, WHITE, SCREEN_WIDTH + 5, loc + 10)
 
 
@@ -162,104 +214,143 @@ for i in range(len(img_list)):
 
 ## GAME LOOP ##
 
-run = True
-while run:
-
-	clock.tick(FPS)
-
-	draw_bg()
-	draw_world()
-	draw_grid()
-	draw_text()
-
-	#save and load data
-	if save_button.draw(screen):
-		#save level data
-		pickle_out = open(f'levels/level{level}_data', 'wb')
-		pickle.dump(world_data, pickle_out)
-		pickle_out.close()
-	if load_button.draw(screen):
-	    #load in level data
-		world_data = []
-		pickle_in = open(f'levels/level{level}_data', 'rb')
-		world_data = pickle.load(pickle_in)
-		level_loaded = level
+if __name__ == '__main__':
+	#fold in edits autosaved by an editor that didn't exit cleanly
+	for name in file_handling.recover_levels():
+		print(f'recovered autosaved edits to level {name}')
+	autosaver = autosave.Autosave()
+
+	run = True
+	while run:
+
+		clock.tick(FPS)
+
+		draw_bg()
+		draw_world()
+		draw_selection()
+		draw_grid()
+		draw_text()
+
+		#save and load data
+		if save_button.draw(panel_queue):
+			#save level data, it's autosaved as this level from now on
+			autosaver.save(level, world_data)
+		if load_button.draw(panel_queue):
+			#load in level data and autosave it from now on
+			world_data = autosaver.load(level)
+			journal.reset(world_data)
+			level_loaded = level
 				
-	#choose a tile
-	button_count = 0
-	for button_count, i in enumerate(button_list):
-		if i.draw(screen):
-			current_tile = button_count
-
-	#highlight the selected tile
-	pygame.draw.rect(screen, RED, button_list[current_tile].rect, 3)
-
-	#scroll the map
-	if scroll_left == True and scroll_x > 0:
-		scroll_x -= 5 * scroll_speed
-	if scroll_right == True and scroll_x < (MAX_COLS * TILE_SIZE) - SCREEN_WIDTH:
-		scroll_x += 5 * scroll_speed
-	if scroll_up == True and scroll_y > 0:
-		scroll_y -= 5 * scroll_speed
-	if scroll_down == True and scroll_y < (MAX_ROWS * TILE_SIZE) - SCREEN_HEIGHT:
-		scroll_y += 5 * scroll_speed
+		#choose a tile
+		button_count = 0
+		for button_count, i in enumerate(button_list):
+			if i.draw(panel_queue):
+				current_tile = button_count
+		panel_queue.flush() #draw the text and buttons
+
+		#write the changes to the autosave log every few seconds
+		autosaver.update()
+
+		#highlight the selected tile
+		pygame.draw.rect(screen, RED, button_list[current_tile].rect, 3)
+
+		#scroll the map
+		if scroll_left == True and scroll_x > 0:
+			scroll_x -= 5 * scroll_speed
+		if scroll_right == True and scroll_x < (MAX_COLS * TILE_SIZE) - SCREEN_WIDTH:
+			scroll_x += 5 * scroll_speed
+		if scroll_up == True and scroll_y > 0:
+			scroll_y -= 5 * scroll_speed
+		if scroll_down == True and scroll_y < (MAX_ROWS * TILE_SIZE) - SCREEN_HEIGHT:
+			scroll_y += 5 * scroll_speed
 	
 
-#add new tiles to the screen
-	#get mouse position
-	pos = pygame.mouse.get_pos()
-	x = (pos[0] + scroll_x) // TILE_SIZE
-	y = (pos[1] + scroll_y) // TILE_SIZE
-
-	#check that the coordinates are within the tile area
-	if pos[0] < SCREEN_WIDTH and pos[1] < SCREEN_HEIGHT:
-		#update tile value
-		if pygame.mouse.get_pressed()[0] == 1:
-			if world_data[y][x] != current_tile:
-				world_data[y][x] = current_tile
-		if pygame.mouse.get_pressed()[2] == 1:
-			world_data[y][x] = -1
-
-#handle key presses
-	for event in pygame.event.get():
-		if event.type == pygame.QUIT:
-			run = False
-		#keyboard presses
-		if event.type == pygame.KEYDOWN:
-			if event.key == pygame.K_UP and level < MAX_LEVELS-1:
-				level += 1
-			if event.key == pygame.K_DOWN and level > 0:
-				level -= 1
-			if event.key == pygame.K_a:
-				scroll_left = True
-			if event.key == pygame.K_d:
-				scroll_right = True
-			if event.key == pygame.K_w:
-				scroll_up = True
-			if event.key == pygame.K_s:
-				scroll_down = True
-			if event.key == pygame.K_RSHIFT:
-				scroll_speed *= 2
-			if event.key == pygame.K_LSHIFT:
-				scroll_speed *= 2
-
-		if event.type == pygame.KEYUP:
-			if event.key == pygame.K_a:
-				scroll_left = False
-			if event.key == pygame.K_d:
-				scroll_right = False
-			if event.key == pygame.K_w:
-				scroll_up = False
-			if event.key == pygame.K_s:
-				scroll_down = False
-			if event.key == pygame.K_RSHIFT:
-				scroll_speed /= 2
-			if event.key == pygame.K_LSHIFT:
-				scroll_speed /= 2
-
-	pygame.display.update()
-
-	if event.type == pygame.QUIT:
-		pygame.quit()
-		break
+	#add new tiles to the screen
+		#get the cell under the mouse, None if it's outside the tile area
+		cell = get_cell(pygame.mouse.get_pos())
+		pressed = pygame.mouse.get_pressed()
+
+		#paint with the brush, everything painted while a button is held is undone together
+		if tool == 'brush' and cell != None:
+			x, y = cell
+			if pressed[0] == 1:
+				journal.begin()
+				journal.set(x, y, current_tile)
+			if pressed[2] == 1:
+				journal.begin()
+				journal.set(x, y, -1)
+		if pressed[0] == 0 and pressed[2] == 0:
+			journal.end()
+
+	#handle key presses
+		for event in pygame.event.get():
+			if event.type == pygame.QUIT:
+				run = False
+			#mouse presses for the bulk tools, left click uses the selected tile and right click erases
+			if event.type == pygame.MOUSEBUTTONDOWN and event.button in (1, 3):
+				cell = get_cell(event.pos)
+				tile = current_tile if event.button == 1 else -1
+				if cell != None:
+					if tool in ('rect', 'copy'):
+						drag_start = cell
+						drag_button = event.button
+					if tool == 'fill':
+						journal.flood_fill(cell[0], cell[1], tile)
+					if tool == 'paste' and clipboard != None and event.button == 1:
+						journal.paste(clipboard, cell[0], cell[1])
+			if event.type == pygame.MOUSEBUTTONUP and event.button == drag_button and drag_start != None:
+				#the corner is clamped to the map if the mouse left it
+				pos = (min(event.pos[0], SCREEN_WIDTH - 1), min(event.pos[1], SCREEN_HEIGHT - 1))
+				cell = get_cell(pos)
+				if tool == 'rect':
+					journal.fill_rect(drag_start[0], drag_start[1], cell[0], cell[1], current_tile if drag_button == 1 else -1)
+				if tool == 'copy':
+					clipboard = journal.copy(drag_start[0], drag_start[1], cell[0], cell[1])
+				drag_start = None
+			#keyboard presses
+			if event.type == pygame.KEYDOWN:
+				if event.mod & pygame.KMOD_CTRL:
+					if event.key == pygame.K_z:
+						journal.undo()
+					if event.key == pygame.K_y:
+						journal.redo()
+				elif event.key in TOOLS:
+					tool = TOOLS[event.key]
+					drag_start = None
+				if event.key == pygame.K_UP and level < MAX_LEVELS-1:
+					level += 1
+				if event.key == pygame.K_DOWN and level > 0:
+					level -= 1
+				if event.key == pygame.K_a:
+					scroll_left = True
+				if event.key == pygame.K_d:
+					scroll_right = True
+				if event.key == pygame.K_w:
+					scroll_up = True
+				if event.key == pygame.K_s:
+					scroll_down = True
+				if event.key == pygame.K_RSHIFT:
+					scroll_speed *= 2
+				if event.key == pygame.K_LSHIFT:
+					scroll_speed *= 2
+
+			if event.type == pygame.KEYUP:
+				if event.key == pygame.K_a:
+					scroll_left = False
+				if event.key == pygame.K_d:
+					scroll_right = False
+				if event.key == pygame.K_w:
+					scroll_up = False
+				if event.key == pygame.K_s:
+					scroll_down = False
+				if event.key == pygame.K_RSHIFT:
+					scroll_speed /= 2
+				if event.key == pygame.K_LSHIFT:
+					scroll_speed /= 2
+
+		pygame.display.update()
+
+	#write and compact the last edits once the loop has ended
+	autosaver.close()
+	pygame.quit()
 	
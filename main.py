@@ -7,64 +7,114 @@
 # LOAD MODULES
 try:
     import sys
-    import pygame
+    from time import perf_counter
     sys.path.append('scripts')
+    from profiler import startup, frame_timer
+    import pygame
+    startup.phase('import pygame')
+    from globals import init_display
+    init_display() # initializes game
+    startup.phase('init display')
     import file_handling
     import physics_obj
-    from globals import * # initializes game
+    import render
+    import level_loader
+    import save_writer
+    import inputs
+    import asset_cache
+    from globals import *
+    startup.phase('import modules')
 except Exception as exc:
     print("ERROR: couldn't load modules.",exc)
     sys.exit()
 
 # HELPER FUNCTIONS
 def load_level(lvl):
-    global level, world_data, tiles, entities, special_tiles
-    level = lvl
-    world_data = file_handling.load_pickle(level)
-    tiles, entities, special_tiles = create_room_objects(world_data)
+    ''' Switch to level lvl, this is just a swap if it was prefetched '''
+    global level, world_data, tiles, entities, triggers, chunks
+    with frame_timer.scope('level loading'):
+        loaded = loader.get(lvl)
+    level, world_data, tiles = loaded.number, loaded.world_data, loaded.tiles
+    entities, triggers, chunks = loaded.entities, loaded.triggers, loaded.chunks
+    for ob in entities: ob.last_tick = frame # sleeping from now on until they first update
+    # prefetch the levels the player can go to from here
+    nearby = set(ob.color_index for ob in entities)
+    nearby.add(save_data['level'])
+    nearby.discard(level)
+    loader.prefetch(nearby)
+
+def build_level(lvl, world_data, cells):
+    ''' Create the objects and tile chunks of a level. Yields between steps so
+        a prefetched level can be built over several frames, returns Level '''
+    tiles, entities, triggers = create_room_objects(world_data, lvl, cells)
+    yield
+    if CHUNK_TILES:
+        chunks = render.Chunk_cache(world_data, tile_images(lvl), TILE_SIZE, bake=False)
+        while chunks.bake_next(CHUNKS_PER_FRAME): yield
+    else: chunks = render.Tile_rows(world_data, tile_images(lvl), TILE_SIZE)
+    return level_loader.Level(lvl, world_data, tiles, entities, triggers, chunks)
+
+def tile_images(lvl):
+    ''' Images of the static (non-entity) tiles, recolored for level lvl '''
+    images = {t:img_list[t] for t in range(TILE_TYPES) if t not in ENTITY_TILES}
+    images[0] = img_dict[DARK_RAINBOW_STR[lvl]]['floor']
+    images[9] = img_dict[DARK_RAINBOW_STR[lvl]]['spike']
+    return images
 
 def draw_bg():
     screen.fill(LIGHT_RAINBOW[level])
 
-def draw_tiles():
-    ''' Draw tile objects on the screen '''
-    for y, row in enumerate(world_data):
-        for x, tile in enumerate(row):
-            if tile >= 0: # if there's a tile
-                if tile == 0:
-                    screen.blit(img_dict[DARK_RAINBOW_STR[level]]['floor'], \
-                        (x * TILE_SIZE - scroll_x, y * TILE_SIZE - scroll_y))
-                elif tile == 9:
-                    screen.blit(img_dict[DARK_RAINBOW_STR[level]]['spike'], \
-                        (x * TILE_SIZE - scroll_x, y * TILE_SIZE - scroll_y))
-                elif tile not in ENTITY_TILES:
-                    screen.blit(img_list[tile], \
-                        (x * TILE_SIZE - scroll_x, y * TILE_SIZE - scroll_y))
+def draw_tiles(scroll_x, scroll_y):
+    ''' Queue the static tiles that are on the screen, as pre-rendered chunks
+        or one by one. They're drawn by render_queue.flush() '''
+    chunks.draw(render_queue, scroll_x, scroll_y)
                     
-def create_room_objects(world_data):
-    ''' Create tile objects from world data '''
-    tiles, entity, special_tiles = [], [], []
-    for y, row in enumerate(world_data):
-        for x, tile in enumerate(row):
-            if tile >= 0: # if there's a tile
-                if tile in range(1,8):
-                    c = tile_data[str(tile)]['color']
-                    o = physics_obj.Orb(orb_img, x * TILE_SIZE, y * TILE_SIZE, \
-                        TILE_SIZE, TILE_SIZE, c)
-                    entity.append(o)
-                elif tile_data[str(tile)]['collision']:
-                    o = physics_obj.Physics_obj(img_list[tile], \
-                        x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-                    tiles.append(o)
-                elif tile == 8: # checkpoint
-                    o = physics_obj.Checkpoint(img_list[tile], \
-                        x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE, level)
-                    special_tiles.append(o)
-                elif tile_data[str(tile)]['death']:
-                    o = physics_obj.Physics_obj(img_list[tile], \
-                        x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE, deadly=True)
-                    special_tiles.append(o)
-    return (tiles,entity,special_tiles)
+def create_room_objects(world_data, lvl, cells=None):
+    ''' Create tile objects from world data
+    args:
+        world_data: 2d list of tile ids
+        lvl: level number
+        cells: list of (tile, x, y) of non-empty cells, scanned from world_data if None
+    '''
+    if cells == None: cells = level_loader.scan_level(world_data)
+    reached = set(tuple(c) for c in save_data['checkpoints_reached'])
+    tiles = physics_obj.Tile_grid(len(world_data), len(world_data[0]))
+    entity, special_tiles = [], []
+    for tile, x, y in cells:
+        if tile in range(1,8):
+            c = tile_data[str(tile)]['color']
+            o = physics_obj.Orb(orb_img, x * TILE_SIZE, y * TILE_SIZE, \
+                TILE_SIZE, TILE_SIZE, c)
+            entity.append(o)
+        elif tile_data[str(tile)]['collision']:
+            o = physics_obj.Physics_obj(img_list[tile], \
+                x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            tiles.set_tile(x, y, o)
+        elif tile == 8: # checkpoint
+            o = physics_obj.Checkpoint(img_list[tile], \
+                x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE, lvl, (lvl, x, y) in reached)
+            special_tiles.append(o)
+        elif tile_data[str(tile)]['death']:
+            o = physics_obj.Physics_obj(img_list[tile], \
+                x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE, deadly=True)
+            special_tiles.append(o)
+    entity = physics_obj.Object_grid(entity)
+    return (tiles,entity,physics_obj.Trigger_index(special_tiles, collectible=entity))
+
+def camera_rect(margin=0):
+    ''' Rect of the level area on screen, grown by margin pixels on each side '''
+    return pygame.Rect(scroll_x - margin, scroll_y - margin, \
+        SCREEN_WIDTH + 2*margin, SCREEN_HEIGHT + 2*margin)
+
+def update_entities():
+    ''' Update entities near the screen, farther entities update less often 
+        or sleep and catch up on their animation when they wake '''
+    margin = IDLE_MARGIN if frame % IDLE_INTERVAL == 0 else ACTIVE_MARGIN
+    for ob in entities.query(camera_rect(margin)):
+        ob.sync(frame)
+        ob.snapshot()
+        ob.update(tiles)
+        entities.relocate(ob)
 
 def scroll_screen(obj):
     ''' Clamps screen scrolling to an object (usually the player) '''
@@ -87,76 +137,191 @@ def scroll_screen(obj):
     if scroll_y > (MAX_ROWS*TILE_SIZE)-SCREEN_HEIGHT: scroll_y = (MAX_ROWS*TILE_SIZE)-SCREEN_HEIGHT
 
 def goto_last_checkpoint():
-    global save_data, level
+    global save_data, level, deaths
+    deaths += 1
     if level != save_data['level']: load_level(save_data['level'])
     if save_data['checkpoint']: player.set_pos(x=save_data['checkpoint'][0],y=save_data['checkpoint'][1])
     else: player.set_pos(x=save_data['player_loc'][0],y=save_data['player_loc'][1])
 
-# load data
-save_data = file_handling.load_json('save_data')
-level = save_data['level']
-world_data = file_handling.load_pickle(level)
-scroll_x, scroll_y = 0, (MAX_ROWS * TILE_SIZE) - SCREEN_HEIGHT
+def start_game(data, start=None):
+    ''' Reset the world to the state in save data
+    args:
+        data: save data, where the player starts and respawns
+        start: (level, x, y) to start the player somewhere else instead, 
+            it still respawns where data says
+    '''
+    global save_data, scroll_x, scroll_y, prev_scroll, frame, player, deaths
+    save_data = data
+    save_data.setdefault('checkpoints_reached', [])
+    loader.prefetch(()) # levels built for an earlier game have its checkpoints
+    scroll_x, scroll_y = 0, (MAX_ROWS * TILE_SIZE) - SCREEN_HEIGHT
+    prev_scroll = (scroll_x, scroll_y) # scroll before the last step
+    frame = 0 # number of frames since the game started
+    deaths = 0 # times the player has been sent back to a checkpoint
+    if start == None: # where the player respawns, the active checkpoint or the level's start
+        start = (save_data['level'], *(save_data['checkpoint'] or save_data['player_loc']))
+    load_level(start[0]) # creates Tile_grid, entities, triggers and tile chunks
+    player = physics_obj.Player(player_img, start[1], start[2], TILE_SIZE, TILE_SIZE)
 
-# load tile images
+def draw(alpha=1):
+    ''' Draw the level, entities and player on the screen
+    args:
+        alpha: how far to draw moving things between their positions 
+            before the last step (0) and now (1)
+    returns:
+        list of rects that changed, or None if the whole screen did
+    '''
+    sx = round(prev_scroll[0] + (scroll_x - prev_scroll[0]) * alpha)
+    sy = round(prev_scroll[1] + (scroll_y - prev_scroll[1]) * alpha)
+    view = camera_rect(TILE_SIZE) # a bit bigger in case things moved on screen since last step
+    sprites = [(t, t.img, t.draw_pos(sx, sy)) for kind, t in triggers.query(view, ('checkpoint',))]
+    sprites += [(ob, ob.img, ob.draw_pos(sx, sy, alpha)) for ob in entities.query(view)]
+    sprites.append((player, player.img, player.draw_pos(sx, sy, alpha)))
+
+    # tiles and sprites are queued and drawn with one blits call, after the background
+    rects = dirty_rects.update((sx, sy, level), sprites) if DIRTY_RECTS else None
+    if rects == None:
+        with frame_timer.scope('background'): draw_bg()
+        with frame_timer.scope('tiles'): draw_tiles(sx, sy)
+        with frame_timer.scope('sprites'):
+            render_queue.blits([(img, pos) for obj, img, pos in sprites])
+        with frame_timer.scope('blits'): render_queue.flush()
+    else: # camera didn't move, only redraw the parts of the screen that changed
+        for rect in rects:
+            screen.set_clip(rect)
+            with frame_timer.scope('background'): draw_bg()
+            with frame_timer.scope('tiles'): draw_tiles(sx, sy)
+            with frame_timer.scope('sprites'):
+                render_queue.blits([(img, pos) for obj, img, pos in sprites \
+                    if rect.colliderect((pos, img.get_size()))])
+            with frame_timer.scope('blits'): render_queue.flush()
+        screen.set_clip(None)
+    return rects
+
+def update_world(keys=pygame.key):
+    ''' Advance the world by one step
+    args:
+        keys: input source, anything with a get_pressed() like pygame.key
+    '''
+    global frame, save_data, prev_scroll
+    frame += 1
+    prev_scroll = (scroll_x, scroll_y)
+    with frame_timer.scope('entities'): update_entities()
+    with frame_timer.scope('player update'):
+        player.snapshot()
+        player.update(tiles, keys.get_pressed())
+    with frame_timer.scope('camera'): scroll_screen(player)
+
+    # handle triggers the player touched, deadly objects first
+    with frame_timer.scope('triggers'):
+        for kind, obj in player.check_triggers(triggers):
+            if kind == 'deadly':
+                goto_last_checkpoint()
+                break
+            elif kind == 'checkpoint':
+                if not obj.active or tuple(save_data['checkpoint'] or ()) != (obj.x, obj.y):
+                    save_data = obj.set_active(save_data)
+                    saver.save(save_data) # written in the background
+            elif kind == 'collectible': # change level if collided with orb
+                load_level(obj.color_index)
+                break
+
+    with frame_timer.scope('level loading'): loader.poll() # build prefetched levels
+
+# load tile images, scaled and recolored images are baked once per TILE_SIZE
+# and kept in a cache file, headless runs that import the game don't use it
+assets = asset_cache.Asset_cache(enabled=__name__ == '__main__')
 tile_data = file_handling.load_json('tile_data')
 img_list = [] # list of pygame images
 for x in range(TILE_TYPES):
-	img = pygame.image.load(f'img/tile/{x}.png').convert_alpha()
-	img = pygame.transform.scale(img, (TILE_SIZE, TILE_SIZE))
-	img_list.append(img)
+	img_list.append(assets.scaled(f'img/tile/{x}.png', (TILE_SIZE, TILE_SIZE)))
+startup.phase('load tile images')
 
 # create images for color variants of ground
 img_dict = {} # dict of pygame images
 for i,c in enumerate(DARK_RAINBOW):
-    floor = physics_obj.replace_pixels(img_list[0], c)
-    spike = physics_obj.replace_pixels(img_list[9], c)
+    floor = assets.recolored(img_list[0], c)
+    spike = assets.recolored(img_list[9], c)
     img_dict[DARK_RAINBOW_STR[i]] = {'floor':floor,'spike':spike}
+startup.phase('recolor tiles')
 
 # other images
-orb_img = pygame.image.load(animation_database['Orb']['img_name']).convert_alpha()
-orb_img = pygame.transform.scale(orb_img, (TILE_SIZE*animation_database['Orb']['frames'], TILE_SIZE))
-
-tiles, entities, special_tiles = create_room_objects(world_data) # list of Physics_obj
+orb_img = assets.scaled(animation_database['Orb']['img_name'], (TILE_SIZE*animation_database['Orb']['frames'], TILE_SIZE))
+player_img = assets.scaled('img/player/idle.png', (TILE_SIZE, TILE_SIZE))
+for c in RAINBOW: # colors of orbs and active checkpoints, recolored when levels are built
+    assets.recolored(orb_img, c, WHITE)
+    assets.recolored(img_list[8], c, WHITE)
+assets.save()
+startup.phase('load other images')
 
-# create player
-img = pygame.image.load('img/player/idle.png').convert_alpha()
-img = pygame.transform.scale(img, (TILE_SIZE, TILE_SIZE))
-player = physics_obj.Player(img, save_data['player_loc'][0], \
-    save_data['player_loc'][1], TILE_SIZE, TILE_SIZE)
+# load data and create level and player
+loader = level_loader.Level_loader(build_level)
+# only the game itself saves, not headless runs that import it
+saver = save_writer.Save_writer('save_data', enabled=__name__ == '__main__')
+dirty_rects = render.Dirty_rects()
+render_queue = render.Render_queue(screen)
+start_game(file_handling.load_json('save_data'))
+startup.phase('load level')
 
 
 # MAIN GAME LOOP
-while 1:
-    clock.tick(60) # Update clock
-
-    # draw and update level
-    draw_bg()
-    draw_tiles()
-    for t in special_tiles: 
-        if type(t) != physics_obj.Physics_obj: t.draw(screen, scroll_x, scroll_y) 
-    for ob in entities:
-        ob.draw(screen, scroll_x, scroll_y)
-        ob.update(tiles)
-    player.draw(screen, scroll_x, scroll_y)
-    player.update(tiles)
-    scroll_screen(player)
+if __name__ == '__main__':
+    # the world is simulated in fixed steps of step_time, drawing happens as 
+    # often as MAX_FPS allows and interpolates between the last two steps
+    step_time = 1 / STEP_RATE
+    lag = 0 # time the simulation is behind real time
 
-    # check if player hit deadly object
-    obj = player.check_special_tiles(special_tiles) 
-    if obj != None:
-        if obj.deadly: goto_last_checkpoint()
-        elif type(obj) == physics_obj.Checkpoint: 
-            save_data = obj.set_active(save_data)
+    # input comes from the keyboard, optionally recorded to a file with 
+    # --record FILE, or from a recording with --replay FILE
+    keys, recorder, replay = pygame.key, None, None
+    if '--replay' in sys.argv:
+        keys = replay = inputs.Replay_input(sys.argv[sys.argv.index('--replay') + 1])
+        start_game(replay.save_data, replay.start)
+        saver.enabled = False # don't overwrite the player's save with the replay's
+    elif '--record' in sys.argv:
+        keys = recorder = inputs.Recorder(pygame.key, sys.argv[sys.argv.index('--record') + 1], save_data)
+    last_time = perf_counter()
+    while 1:
+        clock.tick(MAX_FPS) # Update clock
+        frame_timer.begin_frame()
+        now = perf_counter()
+        lag += now - last_time
+        last_time = now
 
-    # change level if collided with orb
-    lvl = player.check_orbs(entities)
-    if lvl != None: load_level(lvl)
+        steps = 0
+        while lag >= step_time:
+            update_world(keys)
+            lag -= step_time
+            steps += 1
+            if steps == MAX_STEPS_PER_FRAME: # too far behind, drop the rest
+                lag = min(lag, step_time)
+                break
 
-    # quit
-    if pygame.event.get(pygame.QUIT):
-        pygame.quit()
-        sys.exit()
+        rects = draw(lag / step_time)
+        if frame_timer.overlay:
+            frame_timer.draw_overlay(screen)
+            rects = None
 
-    pygame.display.update() # Update screen 
+        # toggle profiler overlay
+        for event in pygame.event.get(pygame.KEYDOWN):
+            if event.key == pygame.K_F3 and frame_timer.enabled:
+                frame_timer.overlay = not frame_timer.overlay
+                dirty_rects.background = None # redraw everything under the overlay
+        # quit, a replay quits once it's finished
+        if pygame.event.get(pygame.QUIT) or (replay != None and replay.done):
+            saver.save(save_data)
+            saver.close() # finish writing the save
+            if recorder != None: recorder.close()
+            if frame_timer.enabled:
+                frame_timer.report()
+                frame_timer.export_trace('frame_trace.json')
+            pygame.quit()
+            sys.exit()
 
+        with frame_timer.scope('display flip'):
+            if rects == None: pygame.display.update() # Update screen 
+            else: pygame.display.update(rects)
+        frame_timer.end_frame()
+        if not startup.reported:
+            startup.phase('first frame')
+            startup.report()
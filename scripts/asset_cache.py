@@ -0,0 +1,111 @@
+# baked images: source images scaled to TILE_SIZE and recolored, kept as raw
+# pixels in one file so later launches don't decode, scale and recolor them
+import os
+import zlib
+import struct
+import pygame
+import file_handling
+import physics_obj
+
+CACHE_PATH = 'img/baked_assets.bin'
+CACHE_MAGIC = b'CBAK'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<4sBI') # magic, version, number of entries
+ENTRY_HEADER = struct.Struct('<HHHI') # bytes of key, width, height, bytes of RGBA pixels
+
+def file_hash(path):
+    ''' crc32 of a file, enough to notice it changed (and cheaper to import 
+        than hashlib, which matters at startup) '''
+    with open(path, 'rb') as file:
+        return f'{zlib.crc32(file.read()):08x}'
+
+class Asset_cache(object):
+    ''' Scaled and recolored images. An image is loaded from the cache file
+        if one was baked from the same source file (by its hash), size and 
+        color, otherwise it's baked and the file is rewritten by save() with 
+        only the images used, so entries of changed sources are replaced.
+        Images are shared, don't draw on them '''
+    def __init__(self, path=CACHE_PATH, enabled=True):
+        '''
+        args:
+            path: cache file
+            enabled: if False every image is baked and the file isn't used,
+                eg. for headless runs, whose TILE_SIZE differs from the game's
+        '''
+        self.path = path
+        self.enabled = enabled
+        self.entries = {} # key -> (width, height, RGBA pixels) read from the file
+        self.used = {} # key -> image, of the images asked for
+        self.keys = {} # id(image) -> key, of the images returned
+        self.hashes = {} # source path -> hash
+        self.baked = 0 # number of images that weren't in the file
+        self.load()
+        self.saved = set(self.entries) # keys of the images in the file
+
+    def load(self):
+        ''' Read every entry of the cache file, a missing or broken file is 
+            treated as empty '''
+        if not self.enabled or not os.path.exists(self.path): return
+        with open(self.path, 'rb') as file:
+            data = memoryview(file.read())
+        try:
+            magic, version, count = CACHE_HEADER.unpack_from(data)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION: return
+            pos = CACHE_HEADER.size
+            for _ in range(count):
+                key_len, width, height, size = ENTRY_HEADER.unpack_from(data, pos)
+                pos += ENTRY_HEADER.size
+                key = bytes(data[pos:pos + key_len]).decode()
+                pos += key_len
+                if size != width * height * 4 or pos + size > len(data): raise ValueError("truncated entry")
+                self.entries[key] = (width, height, data[pos:pos + size])
+                pos += size
+        except (struct.error, ValueError) as exc:
+            print(f"WARNING: ignoring broken asset cache {self.path}.", exc)
+            self.entries = {}
+
+    def image(self, key, bake):
+        ''' Image key from the cache file, or made by calling bake() '''
+        if key in self.used: return self.used[key]
+        if key in self.entries:
+            width, height, pixels = self.entries[key]
+            img = pygame.image.frombytes(pixels.tobytes(), (width, height), 'RGBA').convert_alpha()
+        else:
+            img = bake()
+            self.baked += 1
+        self.used[key] = img
+        self.keys[id(img)] = key
+        return img
+
+    def scaled(self, path, size):
+        ''' Image file path scaled to size (width, height) '''
+        if path not in self.hashes: self.hashes[path] = file_hash(path)
+        key = f'{path} {self.hashes[path]} {size[0]}x{size[1]}'
+        return self.image(key, lambda: pygame.transform.scale(pygame.image.load(path).convert_alpha(), size))
+
+    def recolored(self, img, color, replace=(0,0,0)):
+        ''' physics_obj.replace_pixels(img, color, replace), where img came 
+            from this cache. Later calls of replace_pixels get the same image '''
+        key = f'{self.keys[id(img)]} {tuple(color)} {tuple(replace)}'
+        new_img = self.image(key, lambda: physics_obj.replace_pixels(img, color, replace))
+        physics_obj.add_recolor(img, color, new_img, replace)
+        return new_img
+
+    def save(self):
+        ''' Rewrite the cache file with the images used, if any had to be 
+            baked or entries weren't used. Call once every image is loaded, 
+            the file's pixels are let go of '''
+        self.entries = {}
+        if not self.enabled: return
+        if self.baked == 0 and self.used.keys() == self.saved: return
+        data = bytearray(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(self.used)))
+        for key, img in self.used.items():
+            pixels = pygame.image.tobytes(img, 'RGBA')
+            data += ENTRY_HEADER.pack(len(key.encode()), img.get_width(), img.get_height(), len(pixels))
+            data += key.encode() + pixels
+        try:
+            file_handling.write_atomic(self.path, bytes(data))
+        except OSError as exc:
+            print("WARNING: couldn't save asset cache.", exc)
+        self.saved = set(self.used)
+        self.baked = 0
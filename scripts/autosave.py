@@ -0,0 +1,117 @@
+# autosave for the level editor, edits are appended to a log next to the level
+# file on a worker thread and folded into the level file now and then
+import os
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+import file_handling
+
+AUTOSAVE_INTERVAL = 3 # seconds between writes to the log
+COMPACT_BYTES = 64 * 1024 # fold the log into the level file once it's this big
+
+def save_snapshot(name, world_data):
+    ''' Save a copy of a level and delete its log, which the save replaces '''
+    file_handling.save_level(name, world_data)
+    if os.path.exists(file_handling.log_path(name)):
+        os.remove(file_handling.log_path(name))
+
+def report_error(future):
+    if future.exception() != None:
+        print(f"ERROR: autosave failed: {future.exception()}")
+
+class Autosave(object):
+    ''' Keeps the level being edited saved. Changed cells are packed into log
+        records on the main thread every few seconds, which is cheap, and a
+        worker thread writes them so the frame loop never waits on the disk.
+        Nothing is autosaved until a level has been loaded or saved '''
+    def __init__(self, interval=AUTOSAVE_INTERVAL, compact_bytes=COMPACT_BYTES):
+        '''
+        args:
+            interval: seconds between writes to the log
+            compact_bytes: size of the log at which it's compacted
+        '''
+        self.interval = interval
+        self.compact_bytes = compact_bytes
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None # last task given to the worker
+        self.name = None # level being autosaved
+        self.world_data = None
+        self.dirty = [] # (x, y, n) runs of cells changed since the last write
+        self.log_bytes = 0 # bytes written to the log since it was compacted
+        self.last_write = perf_counter()
+
+    def start(self, name, world_data):
+        ''' Autosave world_data as level name from now on '''
+        self.name = name
+        self.world_data = world_data
+        self.dirty = []
+        self.log_bytes = 0
+        self.last_write = perf_counter()
+
+    def changed(self, x, y, n):
+        ''' Call after cells x to x+n-1 of row y of world_data change '''
+        if self.name != None: self.dirty.append((x, y, n))
+
+    def submit(self, func, *args):
+        self.future = self.executor.submit(func, *args)
+        self.future.add_done_callback(report_error)
+
+    def pack(self):
+        ''' Pack the current tiles of the changed cells into log records,
+            splitting runs where the tile changes '''
+        records = bytearray()
+        for x, y, n in self.dirty:
+            row = self.world_data[y]
+            start = x
+            for cx in range(x + 1, x + n + 1):
+                if cx == x + n or row[cx] != row[start]:
+                    records += file_handling.LOG_RECORD.pack(start, y, cx - start, row[start])
+                    start = cx
+        self.dirty = []
+        return bytes(records)
+
+    def flush(self, compact=False):
+        ''' Give the changed cells to the worker to append to the log, and
+            compact the log if asked to or if it's grown big enough '''
+        self.last_write = perf_counter()
+        if self.name == None: return
+        if self.dirty:
+            records = self.pack()
+            self.log_bytes += len(records)
+            self.submit(file_handling.append_level_log, self.name, \
+                len(self.world_data), len(self.world_data[0]), records)
+        if self.log_bytes > 0 and (compact or self.log_bytes >= self.compact_bytes):
+            self.submit(file_handling.compact_level, self.name)
+            self.log_bytes = 0
+
+    def update(self):
+        ''' Call every frame, writes the changes every interval seconds '''
+        if perf_counter() - self.last_write >= self.interval:
+            self.flush()
+
+    def wait(self):
+        ''' Block until the worker has finished everything given to it '''
+        if self.future != None:
+            try: self.future.result()
+            except Exception: pass # already reported
+
+    def load(self, name):
+        ''' Finish saving the current level, then load level name for editing
+            with any edits recovered from its log. Returns its world_data '''
+        self.flush(compact=True)
+        self.wait()
+        file_handling.compact_level(name)
+        world_data = file_handling.load_level(name, copy=True)
+        self.start(name, world_data)
+        return world_data
+
+    def save(self, name, world_data):
+        ''' Save a copy of world_data as level name on the worker, and
+            autosave it as that level from now on '''
+        if name != self.name: self.flush(compact=True) # finish the old level
+        self.submit(save_snapshot, name, [list(row) for row in world_data])
+        self.start(name, world_data)
+
+    def close(self):
+        ''' Write and compact the remaining changes, then stop the worker '''
+        self.flush(compact=True)
+        self.executor.shutdown(wait=True)
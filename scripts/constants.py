@@ -0,0 +1,54 @@
+# game constants that don't depend on the display. importing this module has
+# no side effects, so tools can use it without opening a window
+
+# DECLARE GLOBAL VARIABLES
+# variables in all caps never change
+MAX_ROWS, MAX_COLS = 150, 150
+
+TILE_TYPES = 10
+ENTITY_TILES = [1,2,3,4,5,6,7,8]
+
+# game loop timing
+STEP_RATE = 60 # simulation steps per second, physics is tuned for 60
+MAX_STEPS_PER_FRAME = 5 # steps run before drawing when behind, extra time is dropped
+MAX_FPS = 144 # limit on frames drawn per second, 0 for no limit
+DIRTY_RECTS = True # only redraw what changed while the camera is still
+
+# entities within IDLE_MARGIN of the screen update every IDLE_INTERVAL frames
+IDLE_INTERVAL = 15
+
+CHUNK_TILES = False # draw static tiles from pre-rendered chunks, otherwise the visible tiles are queued every frame, which is faster
+CHUNKS_PER_FRAME = 16 # tile chunks baked per frame when building a prefetched level
+
+# colors
+BLACK = (0, 0, 0)
+GREY = (128, 128, 128)
+WHITE = (255, 255, 255)
+
+RED = (225, 0, 0)
+ORANGE = (255, 128, 0)
+YELLOW = (225, 225, 0)
+GREEN = (0, 225, 0)
+BLUE = (0, 0, 255)
+INDIGO = (128, 0, 255)
+VIOLET = (255, 0, 255)
+RAINBOW = (RED, ORANGE, YELLOW, GREEN, BLUE, INDIGO, VIOLET)
+
+DARK_RED = (128, 0, 0)
+DARK_ORANGE = (128, 64, 0)
+DARK_YELLOW = (128, 128, 0)
+DARK_GREEN = (0, 128, 0)
+DARK_BLUE = (0, 0, 128)
+DARK_INDIGO = (64, 0, 128)
+DARK_VIOLET = (128, 0, 128)
+DARK_RAINBOW = (DARK_RED,DARK_ORANGE,DARK_YELLOW,DARK_GREEN,DARK_BLUE,DARK_INDIGO,DARK_VIOLET)
+DARK_RAINBOW_STR = ('dark_red','dark_orange','dark_yellow','dark_green','dark_blue','dark_indigo','dark_violet')
+
+LIGHT_RED = (255, 128, 128)
+LIGHT_ORANGE = (255, 178, 128)
+LIGHT_YELLOW = (255, 255, 128)
+LIGHT_GREEN = (128, 255, 128)
+LIGHT_BLUE = (128, 128, 255)
+LIGHT_INDIGO = (178, 128, 255)
+LIGHT_VIOLET = (255, 128, 255)
+LIGHT_RAINBOW = (LIGHT_RED,LIGHT_ORANGE,LIGHT_YELLOW,LIGHT_GREEN,LIGHT_BLUE,LIGHT_INDIGO,LIGHT_VIOLET)
@@ -0,0 +1,187 @@
+# undo/redo history for the level editor, storing only the cells that changed
+import array
+
+# a stroke is an array('h') of runs, 5 values each: x, y, n, old tile, new tile,
+# meaning cells x to x+n-1 of row y changed from old to new
+RUN = 5
+MAX_BYTES = 4 * 1024 * 1024 # oldest strokes are forgotten past this much history
+
+class Edit_journal(object):
+    ''' Records changes to world_data as runs of cells grouped into strokes
+        (one mouse drag or one bulk tool use), which can be undone and redone '''
+    def __init__(self, world_data, on_change=None, max_bytes=MAX_BYTES):
+        '''
+        args:
+            world_data: 2d list (or list of memoryviews) of tile ids
+            on_change: called as on_change(x, y, n) after cells x to x+n-1
+                of row y change, eg. to redraw them
+            max_bytes: size limit of the undo history
+        '''
+        self.on_change = on_change
+        self.max_bytes = max_bytes
+        self.reset(world_data)
+
+    def reset(self, world_data):
+        ''' Start editing world_data with an empty history '''
+        self.world_data = world_data
+        self.rows = len(world_data)
+        self.cols = len(world_data[0])
+        self.undo_stack = []
+        self.redo_stack = []
+        self.stroke = None # runs of the stroke being recorded
+        self.bytes = 0 # size of the undo and redo stacks
+
+    def memory(self):
+        ''' Bytes used by the history '''
+        return self.bytes
+
+    def begin(self):
+        ''' Start a stroke, changes until end() are undone together '''
+        if self.stroke == None:
+            self.stroke = array.array('h')
+
+    def end(self):
+        ''' Finish the stroke, returns True if anything changed '''
+        stroke, self.stroke = self.stroke, None
+        if not stroke: return False
+        self.bytes -= sum(len(s) * s.itemsize for s in self.redo_stack)
+        self.redo_stack = []
+        self.undo_stack.append(stroke)
+        self.bytes += len(stroke) * stroke.itemsize
+        while self.bytes > self.max_bytes and len(self.undo_stack) > 1:
+            old = self.undo_stack.pop(0)
+            self.bytes -= len(old) * old.itemsize
+        return True
+
+    def record(self, x, y, n, old, new):
+        ''' Add a run to the stroke, extending the last run if it continues it '''
+        s = self.stroke
+        if len(s) and s[-4] == y and s[-2] == old and s[-1] == new and s[-5] + s[-3] == x:
+            s[-3] += n
+        else:
+            s.extend((x, y, n, old, new))
+
+    def changed(self, x, y, n):
+        if self.on_change != None: self.on_change(x, y, n)
+
+    def set(self, x, y, tile):
+        ''' Change one cell, returns True if it changed '''
+        old = self.world_data[y][x]
+        if old == tile: return False
+        single = self.stroke == None
+        if single: self.begin()
+        self.world_data[y][x] = tile
+        self.record(x, y, 1, old, tile)
+        self.changed(x, y, 1)
+        if single: self.end()
+        return True
+
+    def apply(self, stroke, undo):
+        for i in (range(len(stroke) - RUN, -1, -RUN) if undo else range(0, len(stroke), RUN)):
+            x, y, n, old, new = stroke[i:i+RUN]
+            tile = old if undo else new
+            row = self.world_data[y]
+            for cx in range(x, x + n):
+                row[cx] = tile
+            self.changed(x, y, n)
+
+    def undo(self):
+        ''' Undo the last stroke, returns False if there's nothing to undo '''
+        self.end()
+        if not self.undo_stack: return False
+        stroke = self.undo_stack.pop()
+        self.apply(stroke, True)
+        self.redo_stack.append(stroke)
+        return True
+
+    def redo(self):
+        ''' Redo the last undone stroke, returns False if there's nothing to redo '''
+        if self.stroke: return False # a new stroke discards the redo history
+        if not self.redo_stack: return False
+        stroke = self.redo_stack.pop()
+        self.apply(stroke, False)
+        self.undo_stack.append(stroke)
+        return True
+
+    ## BULK TOOLS ##
+    # each is recorded as a single stroke, unless called during one
+
+    def clip(self, x0, y0, x1, y1):
+        ''' Order and clip corners of a rectangle of cells (inclusive) to the map '''
+        x0, x1 = max(0, min(x0, x1)), min(self.cols - 1, max(x0, x1))
+        y0, y1 = max(0, min(y0, y1)), min(self.rows - 1, max(y0, y1))
+        return x0, y0, x1, y1
+
+    def fill_rect(self, x0, y0, x1, y1, tile):
+        ''' Set every cell in a rectangle (corners inclusive) to tile '''
+        x0, y0, x1, y1 = self.clip(x0, y0, x1, y1)
+        single = self.stroke == None
+        if single: self.begin()
+        for y in range(y0, y1 + 1):
+            row = self.world_data[y]
+            changed = False
+            for x in range(x0, x1 + 1):
+                old = row[x]
+                if old != tile:
+                    row[x] = tile
+                    self.record(x, y, 1, old, tile)
+                    changed = True
+            if changed: self.changed(x0, y, x1 - x0 + 1)
+        if single: self.end()
+
+    def flood_fill(self, x, y, tile):
+        ''' Set the area of same tiles around (x, y) to tile, connected
+            horizontally and vertically. Fills a whole span of a row at a time '''
+        world_data = self.world_data
+        target = world_data[y][x]
+        if target == tile: return
+        single = self.stroke == None
+        if single: self.begin()
+        seeds = [(x, y)]
+        while seeds:
+            x, y = seeds.pop()
+            row = world_data[y]
+            if row[x] != target: continue
+            # widen the span to both sides and fill it
+            left = x
+            while left > 0 and row[left - 1] == target: left -= 1
+            right = x
+            while right < self.cols - 1 and row[right + 1] == target: right += 1
+            for cx in range(left, right + 1):
+                row[cx] = tile
+            self.record(left, y, right - left + 1, target, tile)
+            self.changed(left, y, right - left + 1)
+            # one seed per span of target tiles above and below
+            for ny in (y - 1, y + 1):
+                if ny < 0 or ny >= self.rows: continue
+                nrow = world_data[ny]
+                inside = False
+                for cx in range(left, right + 1):
+                    if nrow[cx] == target:
+                        if not inside: seeds.append((cx, ny))
+                        inside = True
+                    else:
+                        inside = False
+        if single: self.end()
+
+    def copy(self, x0, y0, x1, y1):
+        ''' Return the cells in a rectangle (corners inclusive) as a list of rows '''
+        x0, y0, x1, y1 = self.clip(x0, y0, x1, y1)
+        return [list(self.world_data[y][x0:x1 + 1]) for y in range(y0, y1 + 1)]
+
+    def paste(self, region, x, y):
+        ''' Write a region from copy() with its top left cell at (x, y),
+            cells past the edge of the map are left out '''
+        single = self.stroke == None
+        if single: self.begin()
+        for dy, tiles in enumerate(region[:max(0, self.rows - y)]):
+            row = self.world_data[y + dy]
+            changed = False
+            for dx, tile in enumerate(tiles[:max(0, self.cols - x)]):
+                old = row[x + dx]
+                if old != tile:
+                    row[x + dx] = tile
+                    self.record(x + dx, y + dy, 1, old, tile)
+                    changed = True
+            if changed: self.changed(x, y + dy, min(len(tiles), self.cols - x))
+        if single: self.end()
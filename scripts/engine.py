@@ -1,18 +1,23 @@
 import pygame, math, os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pygame.locals import *
 
-# global e_colorkey
-# e_colorkey = (255,255,255)
+global e_colorkey
+e_colorkey = (255,255,255)
 
-# global animation_database
-# animation_database = {}
+global animation_database
+animation_database = {}
  
-# global animation_higher_database 
-# animation_higher_database = {}
+global animation_higher_database 
+animation_higher_database = {}
 
-# def set_global_colorkey(colorkey):
-#     global e_colorkey
-#     e_colorkey = colorkey
+global animation_files
+animation_files = {} # entity type -> list of [animation id, path, sequence, tags], loaded when first used
+
+def set_global_colorkey(colorkey):
+    global e_colorkey
+    e_colorkey = colorkey
 
 # physics core
 
@@ -83,6 +88,54 @@ def blit_center(surf,surf2,pos):
     x = int(surf2.get_width()/2)
     y = int(surf2.get_height()/2)
     surf.blit(surf2,(pos[0]-x,pos[1]-y))
+
+# transformed images cache
+TRANSFORM_CACHE_SIZE = 512 # most transformed images kept
+ROTATION_STEP = 1 # rotations are rounded to this many degrees
+
+class Transform_cache(object):
+    ''' Flipped, rotated and faded copies of images, shared by every entity 
+        so an entity whose image, flip, rotation and alpha didn't change 
+        doesn't make new surfaces. The least recently used are dropped once
+        there are more than max_size. Returned images are shared, don't draw on them '''
+    def __init__(self, max_size=TRANSFORM_CACHE_SIZE, rotation_step=ROTATION_STEP):
+        self.max_size = max_size
+        self.rotation_step = rotation_step
+        self.entries = OrderedDict() # (id(img), flip, rotation, alpha) -> (img, transformed img)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self,img,flipped,rotation,alpha=None):
+        ''' img flipped horizontally if flipped, rotated by rotation degrees 
+            and with alpha set if it isn't None '''
+        rotation = round(rotation/self.rotation_step)*self.rotation_step % 360
+        key = (id(img),flipped,rotation,alpha)
+        entry = self.entries.get(key)
+        if entry != None and entry[0] is img:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        new_img = pygame.transform.rotate(flip(img,flipped),rotation)
+        if alpha != None:
+            new_img.set_alpha(alpha)
+        self.entries[key] = (img,new_img) # keep img alive so its id isn't reused
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return new_img
+
+    def stats(self):
+        ''' Dict of hits, misses, hit rate and number of cached images '''
+        total = self.hits+self.misses
+        return {'hits':self.hits,'misses':self.misses,'hit_rate':self.hits/total if total else 0,'size':len(self.entries)}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+global transform_cache
+transform_cache = Transform_cache()
  
 class Entity(object):
     global animation_database, animation_higher_database
@@ -139,6 +192,8 @@ class Entity(object):
             pass
         else:
             self.action = action_id
+            if self.type not in animation_higher_database:
+                load_entity_animations(self.type)
             anim = animation_higher_database[self.type][action_id]
             self.animation = anim[0]
             self.set_animation_tags(anim[1])
@@ -199,63 +254,87 @@ class Entity(object):
             return flip(animation_database[self.animation[self.animation_frame]],self.flip)
 
     def get_drawn_img(self):
-        image_to_render = None
-        if self.animation == None:
-            if self.image != None:
-                image_to_render = flip(self.image,self.flip).copy()
-        else:
-            image_to_render = flip(animation_database[self.animation[self.animation_frame]],self.flip).copy()
-        if image_to_render != None:
-            center_x = image_to_render.get_width()/2
-            center_y = image_to_render.get_height()/2
-            image_to_render = pygame.transform.rotate(image_to_render,self.rotation)
-            if self.alpha != None:
-                image_to_render.set_alpha(self.alpha)
+        ''' Returns (image, center x, center y) of the frame as drawn, the 
+            image is shared through transform_cache so don't draw on it '''
+        image = self.image
+        if self.animation != None:
+            image = animation_database[self.animation[self.animation_frame]]
+        if image != None:
+            center_x = image.get_width()/2
+            center_y = image.get_height()/2
+            image_to_render = transform_cache.get(image,self.flip,self.rotation,self.alpha)
             return image_to_render, center_x, center_y
  
     def display(self,surface,scroll):
-        image_to_render = None
-        if self.animation == None:
-            if self.image != None:
-                image_to_render = flip(self.image,self.flip).copy()
-        else:
-            image_to_render = flip(animation_database[self.animation[self.animation_frame]],self.flip).copy()
-        if image_to_render != None:
-            center_x = image_to_render.get_width()/2
-            center_y = image_to_render.get_height()/2
-            image_to_render = pygame.transform.rotate(image_to_render,self.rotation)
-            if self.alpha != None:
-                image_to_render.set_alpha(self.alpha)
+        drawn = self.get_drawn_img()
+        if drawn != None:
+            image_to_render, center_x, center_y = drawn
             blit_center(surface,image_to_render,(int(self.x)-scroll[0]+self.offset[0]+center_x,int(self.y)-scroll[1]+self.offset[1]+center_y))
  
 # # animation stuff
  
 # # a sequence looks like [[0,1],[1,1],[2,1],[3,1],[4,2]]
 # # the first numbers are the image name(as integer), while the second number shows the duration of it in the sequence
-def animation_sequence(sequence,base_path,colorkey=(255,255,255),transparency=255):
+FRAME_LOADERS = 4 # threads decoding frame images
+
+def frame_id(base_path,n):
+    return base_path + base_path.split('/')[-2] + '_' + str(n)
+
+def decode_frame(image_id):
+    ''' Load a frame's png, safe to run off the main thread '''
+    return pygame.image.load(image_id + '.png')
+
+def load_frames(image_ids,colorkey=(255,255,255),transparency=255):
+    ''' Add the frames not in animation_database yet, each frame is loaded
+        once. The pngs are decoded on a thread pool, converting them to the 
+        display's format is done on the main thread '''
     global animation_database
-    result = []
-    for frame in sequence:
-        image_id = base_path + base_path.split('/')[-2] + '_' + str(frame[0])
-        image = pygame.image.load(image_id + '.png').convert()
+    new = [image_id for image_id in dict.fromkeys(image_ids) if image_id not in animation_database]
+    if len(new) == 0:
+        return
+    with ThreadPoolExecutor(max_workers=min(FRAME_LOADERS,len(new))) as pool:
+        images = list(pool.map(decode_frame,new))
+    for image_id, image in zip(new,images):
+        image = image.convert()
         image.set_colorkey(colorkey)
         image.set_alpha(transparency)
         animation_database[image_id] = image.copy()
+
+def animation_sequence(sequence,base_path,colorkey=(255,255,255),transparency=255):
+    result = []
+    for frame in sequence:
         for i in range(frame[1]):
-            result.append(image_id)
+            result.append(frame_id(base_path,frame[0]))
+    load_frames(result,colorkey,transparency)
     return result
  
  
 def get_frame(ID):
     global animation_database
     return animation_database[ID]
- 
-def load_animations(path):
+
+def load_entity_animations(entity_type):
+    ''' Load the animations of entity_type listed by load_animations, all 
+        their frames are decoded together '''
     global animation_higher_database, e_colorkey
+    animations = animation_files[entity_type]
+    load_frames([frame_id(base_path,frame[0]) for animation_id, base_path, sequence, tags in animations for frame in sequence],e_colorkey)
+    animation_higher_database[entity_type] = {}
+    for animation_id, base_path, sequence, tags in animations:
+        anim = animation_sequence(sequence,base_path,e_colorkey)
+        animation_higher_database[entity_type][animation_id] = [anim,tags]
+ 
+def load_animations(path,lazy=True):
+    ''' Read the animations listed in entity_animations.txt in path. An 
+        entity type's animations are loaded the first time set_action needs
+        one of them, or all now if lazy is False '''
+    global animation_files
     f = open(path + 'entity_animations.txt','r')
     data = f.read()
     f.close()
     for animation in data.split('\n'):
+        if animation.strip() == '':
+            continue
         sections = animation.split(' ')
         anim_path = sections[0]
         entity_info = anim_path.split('/')
@@ -268,10 +347,13 @@ def load_animations(path):
         for timing in timings:
             sequence.append([n,int(timing)])
             n += 1
-        anim = animation_sequence(sequence,path + anim_path,e_colorkey)
-        if entity_type not in animation_higher_database:
-            animation_higher_database[entity_type] = {}
-        animation_higher_database[entity_type][animation_id] = [anim.copy(),tags]
+        if entity_type not in animation_files:
+            animation_files[entity_type] = []
+        animation_files[entity_type].append([animation_id,path + anim_path,sequence,tags])
+        animation_higher_database.pop(entity_type,None) # reloaded with the new animation when next used
+    if not lazy:
+        for entity_type in animation_files:
+            load_entity_animations(entity_type)
 
 # particles
 
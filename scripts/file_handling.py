@@ -1,6 +1,23 @@
-# functions for handling json files
+# functions for handling json and level files
+import os
+import sys
 import json
-import pickle
+import mmap
+import array
+import struct
+
+# binary level files: header then a row-major grid of signed tile ids
+LEVEL_MAGIC = b'CLVL'
+LEVEL_VERSION = 1
+LEVEL_HEADER = struct.Struct('<4sBBHH') # magic, version, bytes per tile, rows, cols
+TILE_FORMATS = {1:'b', 2:'h'} # bytes per tile -> array typecode, stored little endian
+SWAP_TILES = sys.byteorder != 'little' # arrays use the host's byte order
+
+# level logs: edits made since the level file was last written, appended by 
+# the editor's autosave and folded back into the level file by compact_level
+LOG_MAGIC = b'CLOG'
+LOG_HEADER = struct.Struct('<4sHH') # magic, rows, cols
+LOG_RECORD = struct.Struct('<HHHh') # x, y, number of cells, tile they were set to
 
 def load_json(name):
     ''' Load json and return datastructure '''
@@ -11,14 +28,139 @@ def load_json(name):
 def save_json(name, data):
     ''' Save data json. Returns nothing '''
     try:
-        with open(name+'.txt','w') as file:
-            json.dump(data,file)
+        write_atomic(name+'.txt', json.dumps(data).encode())
     except Exception:
         print("ERROR: couldn't save json")
 
+def write_atomic(path, data):
+    ''' Write bytes to a new file and rename it over path, so a crash leaves 
+        either the old or the new file and never part of one. Returns nothing '''
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno()) # on disk before the rename, so a crash can't leave it empty
+    os.replace(path + '.tmp', path)
+
 def load_pickle(name):
-    ''' Load tilemap data for level from pickle '''
+    ''' Load tilemap data for level from pickle (legacy level format) '''
+    import pickle
     data = []
     pickle_in = open(f'levels/level{name}_data', 'rb')
     data = pickle.load(pickle_in)
     return data
+
+def level_path(name):
+    return f'levels/level{name}.lvl'
+
+def level_names():
+    ''' Names of the levels in levels/, binary or legacy pickle, in order '''
+    names = set()
+    for file in os.listdir('levels'):
+        if file.startswith('level') and file.endswith('.lvl'):
+            names.add(file[len('level'):-len('.lvl')])
+        elif file.startswith('level') and file.endswith('_data'):
+            names.add(file[len('level'):-len('_data')])
+    return sorted(names, key=int)
+
+def save_level(name, world_data):
+    ''' Save tilemap data for level as a binary level file. Returns nothing '''
+    rows, cols = len(world_data), len(world_data[0])
+    width = 1 if all(-128 <= t < 128 for row in world_data for t in row) else 2
+    grid = array.array(TILE_FORMATS[width], (t for row in world_data for t in row))
+    if SWAP_TILES: grid.byteswap()
+    # write a new file and rename it over the old one, so a level that is 
+    # memory mapped by a running game keeps its old contents
+    header = LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, width, rows, cols)
+    write_atomic(level_path(name), header + grid.tobytes())
+
+def load_level(name, copy=False):
+    ''' Load tilemap data for level. Binary level files are memory mapped 
+        copy-on-write, so changes stay in memory. Falls back to the legacy pickle.
+    args:
+        name: level number
+        copy: read the file into memory instead of mapping it (use when the 
+            file will be written while the data is in use)
+    returns:
+        list of rows of tile ids, indexed world_data[y][x]
+    '''
+    path = level_path(name)
+    if not os.path.exists(path): return load_pickle(name)
+    with open(path, 'rb') as file:
+        if copy: data = bytearray(file.read())
+        else: data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    return parse_level(data)
+
+def parse_level(data):
+    ''' Return list of rows (memoryviews into data, no copying) of a binary 
+        level. On big endian hosts 2 byte tiles are swapped into a copy '''
+    magic, version, width, rows, cols = LEVEL_HEADER.unpack_from(data)
+    if magic != LEVEL_MAGIC: raise ValueError("not a level file")
+    if version != LEVEL_VERSION: raise ValueError(f"unsupported level version {version}")
+    start = LEVEL_HEADER.size
+    grid = memoryview(data)[start:start + rows*cols*width]
+    if SWAP_TILES and width > 1:
+        grid = array.array(TILE_FORMATS[width], grid.tobytes())
+        grid.byteswap()
+        grid = memoryview(grid)
+    else: grid = grid.cast(TILE_FORMATS[width])
+    return [grid[y*cols:(y+1)*cols] for y in range(rows)]
+
+def log_path(name):
+    return f'levels/level{name}.log'
+
+def append_level_log(name, rows, cols, records):
+    ''' Append packed LOG_RECORDs to a level's log and flush them to disk. 
+        Returns nothing '''
+    path = log_path(name)
+    new = not os.path.exists(path) or os.path.getsize(path) < LOG_HEADER.size
+    with open(path, 'wb' if new else 'ab') as file:
+        if new: file.write(LOG_HEADER.pack(LOG_MAGIC, rows, cols))
+        file.write(records)
+        file.flush()
+        os.fsync(file.fileno())
+
+def read_level_log(name):
+    ''' Read a level's log. A record cut off by a crash is ignored
+    returns:
+        (rows, cols, list of (x, y, n, tile)), or None if there's no log
+    '''
+    path = log_path(name)
+    if not os.path.exists(path): return None
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < LOG_HEADER.size: return None
+    magic, rows, cols = LOG_HEADER.unpack_from(data)
+    if magic != LOG_MAGIC: raise ValueError("not a level log")
+    end = len(data) - (len(data) - LOG_HEADER.size) % LOG_RECORD.size
+    return rows, cols, list(LOG_RECORD.iter_unpack(data[LOG_HEADER.size:end]))
+
+def compact_level(name):
+    ''' Apply a level's log to its level file and delete the log. The log 
+        holds absolute values, so a crash part way through is recovered by 
+        compacting again. Returns True if there was a log '''
+    log = read_level_log(name)
+    if log == None:
+        if os.path.exists(log_path(name)): os.remove(log_path(name))
+        return False
+    rows, cols, records = log
+    try:
+        world_data = load_level(name, copy=True)
+    except FileNotFoundError: # level was never saved
+        world_data = [[-1] * cols for _ in range(rows)]
+    for x, y, n, tile in records:
+        row = world_data[y]
+        for cx in range(x, x + n):
+            row[cx] = tile
+    save_level(name, world_data)
+    os.remove(log_path(name))
+    return True
+
+def recover_levels():
+    ''' Compact the logs left by an editor that didn't exit cleanly. 
+        Returns list of recovered level names '''
+    recovered = []
+    for file in sorted(os.listdir('levels')):
+        if file.startswith('level') and file.endswith('.log'):
+            name = file[len('level'):-len('.log')]
+            if compact_level(name): recovered.append(name)
+    return recovered
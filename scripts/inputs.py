@@ -0,0 +1,157 @@
+# input sources that can stand in for pygame.key, for headless simulation
+# and for recording and replaying play
+import json
+import random
+import struct
+import pygame
+
+# player controls, name -> pygame key
+CONTROLS = {'a':pygame.K_a, 'd':pygame.K_d, 'w':pygame.K_w}
+
+class Key_state(object):
+    ''' Set of held keys, indexable by pygame key constant like the result of 
+        pygame.key.get_pressed() '''
+    def __init__(self, held=()):
+        self.held = frozenset(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+    @classmethod
+    def from_names(cls, names):
+        ''' Create from a string of control names, eg. 'dw' '''
+        return cls(CONTROLS[c] for c in names)
+
+class Scripted_input(object):
+    ''' Plays back a list of (frames, control names) steps, then holds nothing '''
+    def __init__(self, script):
+        self.steps = [(frames, Key_state.from_names(names)) for frames, names in script]
+        self.step = 0
+        self.frame = 0
+
+    @classmethod
+    def parse(cls, text):
+        ''' Create from a string like "30:d,10:dw,20:" '''
+        script = []
+        for step in text.split(','):
+            frames, names = step.split(':')
+            script.append((int(frames), names.strip()))
+        return cls(script)
+
+    def get_pressed(self):
+        while self.step < len(self.steps) and self.frame >= self.steps[self.step][0]:
+            self.step += 1
+            self.frame = 0
+        if self.step == len(self.steps): return Key_state()
+        self.frame += 1
+        return self.steps[self.step][1]
+
+class Random_input(object):
+    ''' Holds random combinations of controls for random lengths of time, 
+        the same seed always gives the same inputs '''
+    def __init__(self, seed, min_hold=5, max_hold=40):
+        self.random = random.Random(seed)
+        self.min_hold = min_hold
+        self.max_hold = max_hold
+        self.keys = Key_state()
+        self.frames_left = 0
+
+    def get_pressed(self):
+        if self.frames_left == 0:
+            names = [c for c in CONTROLS if self.random.random() < 0.5]
+            self.keys = Key_state.from_names(names)
+            self.frames_left = self.random.randint(self.min_hold, self.max_hold)
+        self.frames_left -= 1
+        return self.keys
+
+# recordings: header, the save data json the game started from, then one byte
+# per run of frames with the same controls held: the low 3 bits are the
+# controls (bit i is the i-th of CONTROLS) and the high 5 bits are frames - 1
+RECORDING_MAGIC = b'CREC'
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct('<4sBI') # magic, version, bytes of save data json
+MAX_RUN = 32 # most frames in one run byte
+KEY_STATES = [Key_state(key for i, key in enumerate(CONTROLS.values()) if bits & 1 << i) \
+    for bits in range(1 << len(CONTROLS))] # bits -> Key_state
+
+def key_bits(pressed):
+    ''' Controls held in pressed (a Key_state or pygame's key state) as bits '''
+    bits = 0
+    for i, key in enumerate(CONTROLS.values()):
+        if pressed[key]: bits |= 1 << i
+    return bits
+
+class Recorder(object):
+    ''' Passes on the input of another source and records it to a file, 
+        written as the game runs so a crash loses at most a second '''
+    def __init__(self, source, path, save_data, flush_frames=60, start=None):
+        '''
+        args:
+            source: input source to record, eg. pygame.key
+            path: file to write the recording to
+            save_data: save data the game is starting from
+            flush_frames: frames between writes to disk
+            start: (level, x, y) the player starts at if not where save_data
+                puts it, see main.start_game
+        '''
+        self.source = source
+        self.flush_frames = flush_frames
+        self.bits = 0 # controls held in the current run
+        self.count = 0 # frames in the current run
+        self.frames = 0
+        if start != None: save_data = dict(save_data, start=start) # kept with the save data
+        data = json.dumps(save_data).encode()
+        self.file = open(path, 'wb')
+        self.file.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, len(data)) + data)
+
+    def get_pressed(self):
+        pressed = self.source.get_pressed()
+        bits = key_bits(pressed)
+        if bits == self.bits and 0 < self.count < MAX_RUN:
+            self.count += 1
+        else:
+            self.write_run()
+            self.bits, self.count = bits, 1
+        self.frames += 1
+        if self.frames % self.flush_frames == 0:
+            self.write_run()
+            self.file.flush()
+        return pressed
+
+    def write_run(self):
+        if self.count:
+            self.file.write(bytes((self.bits | (self.count - 1) << 3,)))
+            self.count = 0
+
+    def close(self):
+        ''' Write the last run and close the file '''
+        self.write_run()
+        self.file.close()
+
+class Replay_input(object):
+    ''' Plays back a recording frame by frame, then holds nothing. 
+        Start the game from save_data and start for the replay to match '''
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, size = RECORDING_HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC: raise ValueError("not a recording")
+        if version != RECORDING_VERSION: raise ValueError(f"unsupported recording version {version}")
+        start = RECORDING_HEADER.size
+        self.save_data = json.loads(data[start:start + size])
+        self.start = self.save_data.pop('start', None) # where the player started, None for the saved position
+        self.runs = data[start + size:]
+        self.frames = sum((run >> 3) + 1 for run in self.runs) # length in frames
+        self.run = 0 # index of the current run
+        self.left = 0 # frames left in the current run
+        self.done = False
+
+    def get_pressed(self):
+        while self.left == 0:
+            if self.run == len(self.runs):
+                self.done = True
+                return KEY_STATES[0]
+            self.left = (self.runs[self.run] >> 3) + 1
+            self.run += 1
+        self.left -= 1
+        return KEY_STATES[self.runs[self.run - 1] & 7]
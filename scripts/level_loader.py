@@ -0,0 +1,80 @@
+# loading levels in the background so changing level doesn't stall a frame
+from concurrent.futures import ThreadPoolExecutor
+import file_handling
+
+def scan_level(world_data):
+    ''' Return list of (tile, x, y) for the cells of world_data that have a tile '''
+    return [(tile, x, y) for y, row in enumerate(world_data) \
+        for x, tile in enumerate(row) if tile >= 0]
+
+def read_level(name):
+    ''' Load and scan a level file, safe to run off the main thread '''
+    world_data = file_handling.load_level(name)
+    return world_data, scan_level(world_data)
+
+class Level(object):
+    ''' Everything needed to play a level '''
+    def __init__(self, number, world_data, tiles, entities, triggers, chunks):
+        self.number = number
+        self.world_data = world_data
+        self.tiles = tiles
+        self.entities = entities
+        self.triggers = triggers
+        self.chunks = chunks
+
+class Level_loader(object):
+    ''' Reads and scans level files on a worker thread, then builds them on 
+        the main thread a few steps per frame so switching is a swap '''
+    def __init__(self, build, read=read_level):
+        '''
+        args:
+            build: function (level, world_data, cells) returning a generator 
+                that builds a level one step per next() and returns the Level
+            read: function (level) returning (world_data, cells), run on the
+                worker thread
+        '''
+        self.build = build
+        self.read = read
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.wanted = set() # levels to keep prefetched
+        self.pending = {} # level -> future of (world_data, cells)
+        self.building = {} # level -> build generator
+        self.ready = {} # level -> Level
+
+    def prefetch(self, levels):
+        ''' Start loading levels, forget prefetched levels not in levels '''
+        self.wanted = set(levels)
+        for cache in (self.pending, self.building, self.ready):
+            for lvl in list(cache):
+                if lvl not in self.wanted: del cache[lvl]
+        for lvl in self.wanted:
+            if lvl not in self.pending and lvl not in self.building and lvl not in self.ready:
+                self.pending[lvl] = self.executor.submit(self.read, lvl)
+
+    def poll(self, steps=1):
+        ''' Build loaded levels a few steps at a time, call once per frame '''
+        for lvl, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[lvl]
+                self.building[lvl] = self.build(lvl, *future.result())
+        for lvl, gen in list(self.building.items()):
+            for _ in range(steps):
+                try:
+                    next(gen)
+                except StopIteration as done:
+                    del self.building[lvl]
+                    self.ready[lvl] = done.value
+                    break
+            return # only work on one level per frame
+
+    def get(self, lvl):
+        ''' Return Level lvl, finishing its loading now if it isn't ready '''
+        if lvl in self.ready: return self.ready.pop(lvl)
+        if lvl in self.building: gen = self.building.pop(lvl)
+        elif lvl in self.pending: gen = self.build(lvl, *self.pending.pop(lvl).result())
+        else: gen = self.build(lvl, *self.read(lvl))
+        while True:
+            try:
+                next(gen)
+            except StopIteration as done:
+                return done.value
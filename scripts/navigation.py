@@ -0,0 +1,264 @@
+# navigation graph of a level: the cells the player can stand on and the
+# moves between them, found by simulating the real Player. init_display()
+# must have been called, the moves depend on TILE_SIZE
+import os
+import heapq
+import hashlib
+import file_handling
+import physics_obj
+import inputs
+from globals import TILE_SIZE
+
+NAV_VERSION = 2 # change when the graph or Player's movement changes, invalidates caches
+MAX_FRAMES = 240 # longest move simulated
+JUMP_HOLDS = (1, 3, 6, 11) # frames the jump key is held, 11 is a full jump
+STEER_FRAMES = (0, 6, 12) # frames in the air before changing direction
+ORB_TILES = range(1, 8)
+CHECKPOINT_TILE = 8
+
+# kinds of edges
+WALK = 'walk' # to the next cell along the ground
+FALL = 'fall' # walking off a ledge
+JUMP = 'jump'
+
+def level_hash(name):
+    ''' sha1 of a level's file, the binary level or the legacy pickle '''
+    path = file_handling.level_path(name)
+    if not os.path.exists(path): path = f'levels/level{name}_data'
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+DIRECTION_NAMES = {-1:'a', 0:'', 1:'d'}
+
+class Move(object):
+    ''' Inputs for a move: hold direction (-1 left, 0 none, 1 right) and 
+        jump for the first hold frames. After steer frames in the air the 
+        direction changes to after. With run the player starts at full 
+        speed, as if it ran up to the starting cell '''
+    def __init__(self, direction, run, hold, steer=None, after=0):
+        self.direction = direction
+        self.run = run
+        self.hold = hold
+        self.steer = steer
+        self.after = after
+
+    def __repr__(self):
+        return f'Move({self.direction}, {self.run}, {self.hold}, {self.steer}, {self.after})'
+
+    def pressed(self, frame, air_frames):
+        ''' Keys held on frame, after air_frames frames in the air '''
+        direction = self.direction
+        if self.steer != None and air_frames > self.steer: direction = self.after
+        return KEYS[(direction, frame < self.hold)]
+
+KEYS = {(direction, jump): inputs.Key_state.from_names(names + ('w' if jump else '')) \
+    for direction, names in DIRECTION_NAMES.items() for jump in (False, True)}
+
+def moves_from(can_run):
+    ''' The moves tried from a cell
+    args:
+        can_run: (left, right) whether the player can run into the cell from
+            the right (to move left) and from the left (to move right)
+    '''
+    moves = []
+    for direction in (-1, 0, 1):
+        runs = (False, True) if direction != 0 and can_run[direction == 1] else (False,)
+        holds = [(False, 0)] if direction != 0 else [] # walk
+        holds += [(run, hold) for run in runs for hold in JUMP_HOLDS]
+        for run, hold in holds:
+            moves.append(Move(direction, run, hold))
+            # steer in the air: stop or turn around, or drift after jumping straight up
+            for after in ((0, -direction) if direction != 0 else (-1, 1)):
+                for steer in STEER_FRAMES: moves.append(Move(direction, run, hold, steer, after))
+    return moves
+
+class Nav_graph(object):
+    ''' Cells the player can stand on (nodes) and the moves between them
+        (edges), with the orbs and checkpoints each node's moves touch '''
+    def __init__(self, world_data, tile_data):
+        '''
+        args:
+            world_data: 2d list of tile ids
+            tile_data: dict of tile id (string) -> tile properties, from tile_data.txt
+        '''
+        self.world_data = world_data
+        self.rows, self.cols = len(world_data), len(world_data[0])
+        self.solid = set()
+        self.deadly = set()
+        self.items = {} # (x, y) -> tile id of orbs and checkpoints
+        self.tiles = physics_obj.Tile_grid(self.rows, self.cols)
+        for y, row in enumerate(world_data):
+            for x, tile in enumerate(row):
+                if tile < 0: continue
+                if tile in ORB_TILES or tile == CHECKPOINT_TILE:
+                    self.items[(x, y)] = tile
+                elif tile_data[str(tile)]['collision']:
+                    self.solid.add((x, y))
+                    self.tiles.set_tile(x, y, physics_obj.Physics_obj(None, \
+                        x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+                elif tile_data[str(tile)]['death']:
+                    self.deadly.add((x, y))
+        self.nodes = [] # (x, y) cells
+        self.index = {} # (x, y) -> node index
+        self.edges = [] # node index -> list of (node index, kind, frames, Move)
+        self.touches = [] # node index -> set of item cells touched standing there or by its moves
+
+    def standable(self, x, y):
+        ''' True if the player can stand in cell (x, y) '''
+        return 0 <= x < self.cols and 0 <= y < self.rows - 1 and (x, y) not in self.solid \
+            and (x, y) not in self.deadly and (x, y + 1) in self.solid
+
+    def add_node(self, cell):
+        self.index[cell] = len(self.nodes)
+        self.nodes.append(cell)
+        self.edges.append([])
+        self.touches.append(set())
+
+    def node_at(self, rect):
+        ''' Node the player is standing on with rect, None if it isn't standing '''
+        if rect.bottom % TILE_SIZE != 0: return None
+        y = rect.y // TILE_SIZE
+        for x in (rect.centerx // TILE_SIZE, rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE):
+            if (x, y) in self.index: return self.index[(x, y)]
+        return None
+
+    def cells(self, rect):
+        ''' Cells overlapped by rect '''
+        return [(x, y) for y in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1) \
+            for x in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1)]
+
+    def simulate(self, node, move):
+        ''' Simulate move from node
+        returns:
+            (node index landed on or None, edge kind, frames, set of item cells touched)
+        '''
+        x, y = self.nodes[node]
+        player = physics_obj.Player(None, x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        if move.run: player.move_x = move.direction * player.maxSpeed
+        touched = set()
+        airborne = False
+        air_frames = 0
+        last = player.rect.topleft
+        for frame in range(MAX_FRAMES):
+            player.update(self.tiles, move.pressed(frame, air_frames))
+            for cell in self.cells(player.rect):
+                if cell in self.deadly: return None, None, frame + 1, touched
+                if cell in self.items:
+                    touched.add(cell)
+                    if self.items[cell] in ORB_TILES: # collecting an orb changes level
+                        return None, None, frame + 1, touched
+            if physics_obj.collision_test(player.rect.move(0, 1), self.tiles):
+                end = self.node_at(player.rect)
+                if airborne:
+                    return end, (FALL if move.hold == 0 else JUMP), frame + 1, touched
+                if move.hold == 0 and end != node:
+                    return end, WALK, frame + 1, touched
+                if frame >= move.hold and player.rect.topleft == last:
+                    break # stuck against a wall or the jump was blocked
+            else:
+                airborne = True
+                air_frames += 1
+            last = player.rect.topleft
+        return None, None, MAX_FRAMES, touched
+
+    def drop(self, px, py):
+        ''' Node the player lands on when let go at pixel position (px, py)
+            with no input, eg. arriving from another level. None if it doesn't land '''
+        player = physics_obj.Player(None, px, py, TILE_SIZE, TILE_SIZE)
+        for frame in range(MAX_FRAMES):
+            player.update(self.tiles, inputs.Key_state()) # pushes it out of walls like in the game
+            if any(cell in self.deadly for cell in self.cells(player.rect)): return None
+            if physics_obj.collision_test(player.rect.move(0, 1), self.tiles):
+                node = self.node_at(player.rect)
+                if node != None: return node
+        return None
+
+    def build(self):
+        ''' Find the nodes and simulate every move from each of them '''
+        for y in range(self.rows):
+            for x in range(self.cols):
+                if self.standable(x, y): self.add_node((x, y))
+        for node, (x, y) in enumerate(self.nodes):
+            if (x, y) in self.items: self.touches[node].add((x, y))
+            for move in moves_from((self.standable(x + 1, y), self.standable(x - 1, y))):
+                end, kind, frames, touched = self.simulate(node, move)
+                self.touches[node] |= touched
+                if end != None and end != node:
+                    self.edges[node].append((end, kind, frames, move))
+        return self
+
+    ## QUERIES ##
+
+    def reachable(self, starts):
+        ''' Set of nodes that can be reached from the nodes in starts '''
+        seen = set(starts)
+        stack = list(seen)
+        while stack:
+            for end, kind, frames, move in self.edges[stack.pop()]:
+                if end not in seen:
+                    seen.add(end)
+                    stack.append(end)
+        return seen
+
+    def touched(self, nodes):
+        ''' Item cells touched from any of nodes '''
+        cells = set()
+        for node in nodes: cells |= self.touches[node]
+        return cells
+
+    def path(self, start, goal):
+        ''' Fastest way from node start to node goal
+        returns:
+            list of (node index, kind, frames, Move) edges to follow, or None
+            if goal can't be reached
+        '''
+        best = {start: 0}
+        came_from = {}
+        queue = [(0, start)]
+        while queue:
+            cost, node = heapq.heappop(queue)
+            if node == goal: break
+            if cost > best[node]: continue
+            for edge in self.edges[node]:
+                end, frames = edge[0], edge[2]
+                if cost + frames < best.get(end, float('inf')):
+                    best[end] = cost + frames
+                    came_from[end] = (node, edge)
+                    heapq.heappush(queue, (cost + frames, end))
+        if goal not in best: return None
+        steps = []
+        while goal != start:
+            goal, edge = came_from[goal]
+            steps.append(edge)
+        return steps[::-1]
+
+    ## CACHING ##
+
+    def to_json(self):
+        return {
+            'nodes': self.nodes,
+            'edges': [[node, end, kind, frames, move.direction, move.run, move.hold, move.steer, move.after] \
+                for node, edges in enumerate(self.edges) for end, kind, frames, move in edges],
+            'touches': [[node, x, y] for node, cells in enumerate(self.touches) for x, y in sorted(cells)],
+        }
+
+    def from_json(self, data):
+        for x, y in data['nodes']: self.add_node((x, y))
+        for node, end, kind, frames, direction, run, hold, steer, after in data['edges']:
+            self.edges[node].append((end, kind, frames, Move(direction, run, hold, steer, after)))
+        for node, x, y in data['touches']: self.touches[node].add((x, y))
+        return self
+
+def load_graph(name, tile_data, cache=True):
+    ''' Navigation graph of level name, from the cache in
+        levels/level{name}_nav.txt if it was built from the same level file
+        with the same TILE_SIZE, otherwise built and cached '''
+    key = {'version': NAV_VERSION, 'hash': level_hash(name), 'tile_size': TILE_SIZE}
+    graph = Nav_graph(file_handling.load_level(name), tile_data)
+    cache_name = f'levels/level{name}_nav'
+    if cache and os.path.exists(cache_name + '.txt'):
+        data = file_handling.load_json(cache_name)
+        if data['key'] == key: return graph.from_json(data)
+    graph.build()
+    if cache: file_handling.save_json(cache_name, dict(graph.to_json(), key=key))
+    return graph
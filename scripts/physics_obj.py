@@ -1,33 +1,186 @@
 import pygame
 
-from globals import TILE_SIZE, MAX_ROWS, MAX_COLS, WHITE, RAINBOW, animation_database
+from globals import TILE_SIZE, MAX_ROWS, MAX_COLS, WHITE, RAINBOW, animation_database # init_display() must have been called
 
 def collision_test(object_1,object_list):
     ''' Check if an object collides with a list of objects 
     args:
         object_1: rect of object to check collisions
-        object_list: list of Physics_obj of objects to check 
+        object_list: list of Physics_obj of objects to check, a Tile_grid or an Object_grid
     returns:
         list of rects that object_1 collides with
     '''
+    if isinstance(object_list, (Tile_grid, Object_grid)):
+        return object_list.query(object_1)
     collision_list = []
     for obj in object_list:
         if obj.rect.colliderect(object_1):
             collision_list.append(obj)
     return collision_list
 
+recolor_cache = {} # (id(img), color, replace) -> (img, recolored img)
+
 def replace_pixels(img, color, replace=(0,0,0)):
     ''' Replace all pixels in img (pygame image) with the RGB values replace 
-        with the RGB values color, preserve transparency '''
-    img = img.copy()
-    w, h = img.get_size()
-    r, g, b = color
-    for x in range(w):
-        for y in range(h):
-            pixel = img.get_at((x, y))
-            if pixel[:3] == replace:
-                img.set_at((x, y), pygame.Color(r, g, b, pixel[3]))
-    return img
+        with the RGB values color, preserve transparency. Each recolor is only
+        computed once, the returned image is shared so don't draw on it '''
+    key = (id(img), tuple(color), tuple(replace))
+    if key in recolor_cache: return recolor_cache[key][1]
+    # mask of pixels matching replace, ignoring alpha
+    mask = pygame.mask.from_threshold(img, replace, (1,1,1,255))
+    new_img = img.copy()
+    # zero the RGB of masked pixels then add color to them, alpha is untouched
+    new_img.blit(mask.to_surface(setcolor=(0,0,0), unsetcolor=WHITE), (0,0), \
+        special_flags=pygame.BLEND_RGB_MULT)
+    new_img.blit(mask.to_surface(setcolor=color, unsetcolor=(0,0,0)), (0,0), \
+        special_flags=pygame.BLEND_RGB_ADD)
+    recolor_cache[key] = (img, new_img) # keep img alive so its id isn't reused
+    return new_img
+
+def add_recolor(img, color, new_img, replace=(0,0,0)):
+    ''' Use new_img as the result of replace_pixels(img, color, replace), eg.
+        when it was loaded from the asset cache '''
+    recolor_cache[(id(img), tuple(color), tuple(replace))] = (img, new_img)
+
+frame_cache = {} # (id(sprite sheet), frames, width, height) -> (sprite sheet, tuple of frames)
+
+def get_frames(sprite_sheet, frames, width, height):
+    ''' Cut sprite_sheet into a tuple of frames images of size (width, height).
+        Each sheet is only cut once and the frames are shared, don't draw on them.
+        Frames are drawn onto a new surface as Entity always drew them, so 
+        frames past the end of the sheet are blank '''
+    key = (id(sprite_sheet), frames, width, height)
+    if key not in frame_cache:
+        images = []
+        for i in range(frames):
+            img = pygame.Surface((width, height)).convert_alpha()
+            img.blit(sprite_sheet, (0,0), area=(i*width, 0, (i+1)*width-1, height))
+            images.append(img)
+        frame_cache[key] = (sprite_sheet, tuple(images)) # keep sheet alive so its id isn't reused
+    return frame_cache[key][1]
+
+class Tile_grid(object):
+    ''' Collidable tiles indexed by their cell in the tilemap, so collision 
+        tests only look at the cells a rect overlaps instead of every tile '''
+    def __init__(self, rows, cols, tile_size=TILE_SIZE):
+        self.rows = rows
+        self.cols = cols
+        self.tile_size = tile_size
+        self.cells = [[None] * cols for _ in range(rows)]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        ''' Iterate tiles in row-major order (same order as the tiles list) '''
+        for row in self.cells:
+            for obj in row:
+                if obj != None: yield obj
+
+    def set_tile(self, x, y, obj):
+        ''' Place obj (Physics_obj or None) in cell (x, y) '''
+        if self.cells[y][x] != None: self.count -= 1
+        if obj != None: self.count += 1
+        self.cells[y][x] = obj
+
+    def query(self, rect):
+        ''' Return the tiles that collide with rect, in row-major order '''
+        size = self.tile_size
+        x0, x1 = max(0, rect.left // size), min(self.cols - 1, (rect.right - 1) // size)
+        y0, y1 = max(0, rect.top // size), min(self.rows - 1, (rect.bottom - 1) // size)
+        collision_list = []
+        for y in range(y0, y1 + 1):
+            row = self.cells[y]
+            for x in range(x0, x1 + 1):
+                obj = row[x]
+                if obj != None and obj.rect.colliderect(rect):
+                    collision_list.append(obj)
+        return collision_list
+
+class Object_grid(object):
+    ''' Physics_obj bucketed into square cells by position, so objects near a 
+        region can be found without looking at every object in the level '''
+    def __init__(self, objects=(), cell_size=TILE_SIZE*8):
+        self.cell_size = cell_size
+        self.cells = {} # (cell x, cell y) -> list of objects in that cell
+        self.keys = {} # object -> (insertion order, cells the object is in)
+        self.order = 0
+        for obj in objects: self.insert(obj)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        ''' Iterate objects in insertion order '''
+        return iter(list(self.keys))
+
+    def get_cells(self, rect):
+        ''' Return list of cells that rect overlaps '''
+        size = self.cell_size
+        x0, x1 = rect.left // size, (rect.right - 1) // size
+        y0, y1 = rect.top // size, (rect.bottom - 1) // size
+        return [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+    def insert(self, obj):
+        cells = self.get_cells(obj.rect)
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(obj)
+        self.keys[obj] = (self.order, cells)
+        self.order += 1
+
+    def remove(self, obj):
+        order, cells = self.keys.pop(obj)
+        for cell in cells:
+            self.cells[cell].remove(obj)
+            if not self.cells[cell]: del self.cells[cell]
+
+    def relocate(self, obj):
+        ''' Move obj to the cells it overlaps now, call after obj moves '''
+        order, cells = self.keys[obj]
+        new_cells = self.get_cells(obj.rect)
+        if new_cells != cells:
+            for cell in cells:
+                self.cells[cell].remove(obj)
+                if not self.cells[cell]: del self.cells[cell]
+            for cell in new_cells:
+                self.cells.setdefault(cell, []).append(obj)
+            self.keys[obj] = (order, new_cells)
+
+    def query(self, rect):
+        ''' Return the objects that collide with rect, in insertion order '''
+        found = set()
+        for cell in self.get_cells(rect):
+            for obj in self.cells.get(cell, ()):
+                if obj not in found and obj.rect.colliderect(rect):
+                    found.add(obj)
+        return sorted(found, key=lambda obj: self.keys[obj][0])
+
+# kinds of trigger, in the order they're handled when the player touches several
+TRIGGER_KINDS = ('deadly', 'checkpoint', 'collectible')
+
+class Trigger_index(object):
+    ''' Trigger volumes (objects the player sets off by touching) in an 
+        Object_grid per kind of trigger '''
+    def __init__(self, objects=(), **grids):
+        '''
+        args:
+            objects: Physics_obj with a trigger kind to add
+            grids: existing Object_grids to use for a kind, eg. collectible=entities
+        '''
+        self.grids = {kind:grids.get(kind, Object_grid()) for kind in TRIGGER_KINDS}
+        for obj in objects: self.insert(obj)
+
+    def insert(self, obj):
+        self.grids[obj.trigger].insert(obj)
+
+    def remove(self, obj):
+        self.grids[obj.trigger].remove(obj)
+
+    def query(self, rect, kinds=TRIGGER_KINDS):
+        ''' Return list of (kind, obj) for every trigger of kinds that collides
+            with rect, ordered by kind (as in TRIGGER_KINDS) then insertion order '''
+        return [(kind, obj) for kind in kinds for obj in self.grids[kind].query(rect)]
 
 class Physics_obj(object):
     ''' Collidable object '''
@@ -39,15 +192,33 @@ class Physics_obj(object):
         self.x = x
         self.y = y
         self.deadly = deadly
+        self.trigger = 'deadly' if deadly else None # kind of trigger, see TRIGGER_KINDS
+        self.prev_x, self.prev_y = self.rect.x, self.rect.y # position before the last step
+
+    def draw(self, surface, scroll_x, scroll_y, alpha=1):
+        surface.blit(self.img, self.draw_pos(scroll_x, scroll_y, alpha))
 
-    def draw(self, surface, scroll_x, scroll_y):
-        surface.blit(self.img, (self.rect.x - scroll_x, self.rect.y - scroll_y))
+    def draw_pos(self, scroll_x, scroll_y, alpha=1):
+        ''' Return position on screen to draw at
+        args:
+            alpha: how far to draw between the position before the last 
+                step (0) and the current position (1)
+        '''
+        x, y = self.rect.x, self.rect.y
+        if alpha != 1:
+            x = round(self.prev_x + (x - self.prev_x) * alpha)
+            y = round(self.prev_y + (y - self.prev_y) * alpha)
+        return (x - scroll_x, y - scroll_y)
+
+    def snapshot(self):
+        ''' Remember the current position for interpolating, call before each step '''
+        self.prev_x, self.prev_y = self.rect.x, self.rect.y
 
     def move(self,movement,tiles):
         ''' Handle collisions when moving
         args:
             movement: tup (x,y) of pixels to move
-            platforms: list of rects to check for collisions with
+            tiles: list of Physics_obj (or a Tile_grid) to check for collisions with
         returns:
             collision_data: dict containing data about direction of collisions
         '''
@@ -91,13 +262,16 @@ class Physics_obj(object):
         return collision_data
 
     def set_pos(self, x=None, y=None):
+        ''' Teleport to (x, y), won't be interpolated from the old position '''
         if x != None:
             self.x = x
             self.rect.x = x
+            self.prev_x = x
             self.move_x = 0
         if y != None:
             self.y = y
             self.rect.y = y
+            self.prev_y = y
             self.move_y = 0
 
 class Entity(Physics_obj):
@@ -111,6 +285,7 @@ class Entity(Physics_obj):
         self.gravity = gravity
         self.term_vel = term_vel
         self.animated = False
+        self.last_tick = None # last frame the entity was updated on
 
         # animation 
         if animation_len != 0:
@@ -143,13 +318,33 @@ class Entity(Physics_obj):
             else:
                 self.frame_time -= 1
     
+    def sync(self, tick):
+        ''' Catch up on the frames slept through since the last update, 
+            call before drawing and updating on frame tick '''
+        if self.last_tick != None and tick - self.last_tick > 1:
+            self.skip_frames(tick - self.last_tick - 1)
+        self.last_tick = tick
+
+    def skip_frames(self, frames):
+        ''' Advance the animation as if update was called frames times.
+            Movement is not simulated while an entity sleeps. '''
+        if not self.animated: return
+        frame_ticks = self.frame_len + 1
+        period = (self.animation_len + 1) * frame_ticks
+        phase = self.animation_frame * frame_ticks + self.frame_len - self.frame_time
+        phase = (phase + frames) % period
+        self.frame_time = self.frame_len - phase % frame_ticks
+        if phase // frame_ticks != self.animation_frame:
+            self.animation_frame = phase // frame_ticks
+            self.get_image()
+
     def get_image(self):
-        self.img = pygame.Surface((self.width, self.height)).convert_alpha()
-        self.img.blit(self.sprite_sheet, (0,0), area=(self.animation_frame*self.width, 0, (self.animation_frame+1)*self.width-1, self.height))
+        self.img = self.frames[self.animation_frame]
 
     def load_animation(self, img, animation_len):
         self.sprite_sheet = img
         self.animation_len = animation_len
+        self.frames = get_frames(img, animation_len+1, self.width, self.height)
         self.animation_frame = 0
         self.frame_time = self.frame_len
         self.get_image()
@@ -178,7 +373,11 @@ class Player(Entity):
         self.maxJumpCount = 10
         self.jumpCount = self.maxJumpCount
 
-    def update(self,tiles):
+    def update(self,tiles,pressed=None):
+        ''' args:
+            tiles: collidable tiles (list of Physics_obj or Tile_grid)
+            pressed: key state indexable by pygame key constant, reads the keyboard if None
+        '''
         test = self.rect.copy()
         test.y += 1
         on_ground = collision_test(test, tiles)
@@ -191,7 +390,7 @@ class Player(Entity):
             self.is_jumping = False
 
         # Handle player inputs
-        pressed = pygame.key.get_pressed()
+        if pressed == None: pressed = pygame.key.get_pressed()
 
         # horizontal acceleration
         if pressed[pygame.K_a]:
@@ -238,40 +437,44 @@ class Player(Entity):
         self.move((self.move_x,self.move_y), tiles)
         self.keep_in_bounds()
 
-    def check_orbs(self, objects):
-        obj_collided = collision_test(self.rect, objects)
-        for obj in obj_collided:
-            if type(obj) == Orb: return obj.color_index
-        return None
-
-    def check_special_tiles(self, objects):
-        obj_collided = collision_test(self.rect, objects)
-        for obj in obj_collided:
-            return obj
-        return None
+    def check_triggers(self, triggers):
+        ''' Return list of (kind, obj) of every trigger in the Trigger_index 
+            triggers that the player overlaps, most important first '''
+        return triggers.query(self.rect)
 
 class Orb(Entity):
     ''' Collectable orb '''
     def __init__(self,img,x,y,x_size,y_size,color,animation_len=animation_database['Orb']['frames'],frame_len=animation_database['Orb']['len']):
         super().__init__(img,x,y,x_size,y_size,animation_len=animation_len,frame_len=frame_len)
         self.gravity = 0
+        self.trigger = 'collectible'
         self.color_index = color
         self.color = RAINBOW[color]
         self.sprite_sheet = replace_pixels(self.sprite_sheet,self.color,(255,255,255))
+        self.frames = get_frames(self.sprite_sheet, self.animation_len+1, self.width, self.height)
         self.get_image()
 
 class Checkpoint(Physics_obj):
     def __init__(self,img,x,y,x_size,y_size,level,active=False):
         super().__init__(img,x,y,x_size,y_size)
-        self.active = active
+        self.trigger = 'checkpoint'
+        self.active = False
         self.level = level
+        if active: self.activate() # reached in an earlier game
 
     def set_active(self, save_data):
         if not self.active: self.activate()
         save_data['checkpoint'] = (self.x,self.y)
         save_data['level'] = self.level
+        if self.key() not in save_data['checkpoints_reached']:
+            save_data['checkpoints_reached'].append(self.key())
         return save_data
 
+    def key(self):
+        ''' How the checkpoint is listed in save_data['checkpoints_reached']: 
+            [level, column, row], in tiles so it doesn't depend on TILE_SIZE '''
+        return [self.level, self.x // TILE_SIZE, self.y // TILE_SIZE]
+
     def activate(self):
         self.active = True
         self.img = replace_pixels(self.img, RAINBOW[self.level], WHITE)
@@ -0,0 +1,152 @@
+# timing of the game's startup and per-frame phases
+import os
+import sys
+import json
+from time import perf_counter
+from collections import deque
+
+# enable with the --profile-startup argument or COLORS_PROFILE_STARTUP=1
+PROFILE_STARTUP = '--profile-startup' in sys.argv or os.environ.get('COLORS_PROFILE_STARTUP') == '1'
+
+class Startup_timer(object):
+    ''' Records how long each phase of startup took, phases are ended by 
+        calling phase() so they run back to back from when this was created '''
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.start = perf_counter()
+        self.last = self.start
+        self.phases = [] # list of (name, seconds)
+        self.reported = not enabled # nothing to report when off, so callers can skip it
+
+    def phase(self, name):
+        ''' Mark the end of the phase called name '''
+        if not self.enabled: return
+        now = perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        ''' Print the time of each phase and the total, only once '''
+        if not self.enabled or self.reported: return
+        self.reported = True
+        for name, seconds in self.phases:
+            print(f"{name:24} {seconds*1000:8.1f} ms")
+        print(f"{'total':24} {(self.last - self.start)*1000:8.1f} ms")
+
+startup = Startup_timer(PROFILE_STARTUP)
+
+# enable with the --profile argument or COLORS_PROFILE=1
+PROFILE_FRAMES = '--profile' in sys.argv or os.environ.get('COLORS_PROFILE') == '1'
+
+class Null_scope(object):
+    ''' Scope that does nothing, used when profiling is off '''
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+NULL_SCOPE = Null_scope()
+
+class Scope(object):
+    ''' Times a with block and adds it to a Frame_timer '''
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, self.start, perf_counter())
+        return False
+
+class Frame_timer(object):
+    ''' Times named phases of each frame, keeps rolling stats, records 
+        frames that went over budget and can export a Chrome trace '''
+    def __init__(self, enabled=False, window=300, budget=1/60, max_events=200000):
+        '''
+        args:
+            enabled: when False, scope() returns a shared no-op scope
+            window: number of frames the rolling stats cover
+            budget: frame time in seconds above which a frame is a hitch
+            max_events: number of trace events kept (oldest are dropped)
+        '''
+        self.enabled = enabled
+        self.window = window
+        self.budget = budget
+        self.overlay = False
+        self.font = None
+        self.times = {} # phase -> deque of ms per frame
+        self.phases = {} # phase -> seconds spent this frame
+        self.frame = 0
+        self.frame_start = None
+        self.origin = perf_counter()
+        self.hitches = deque(maxlen=100) # (frame, frame ms, worst phase, phase ms)
+        self.events = deque(maxlen=max_events) # trace events
+
+    def scope(self, name):
+        ''' Return context manager that times a phase called name '''
+        if not self.enabled: return NULL_SCOPE
+        return Scope(self, name)
+
+    def add(self, name, start, end):
+        self.phases[name] = self.phases.get(name, 0) + end - start
+        self.events.append({'name':name, 'ph':'X', 'pid':0, 'tid':0, \
+            'ts':(start - self.origin) * 1e6, 'dur':(end - start) * 1e6})
+
+    def begin_frame(self):
+        if not self.enabled: return
+        self.phases = {}
+        self.frame_start = perf_counter()
+
+    def end_frame(self):
+        ''' Record this frame's phase times and check it for a hitch '''
+        if not self.enabled or self.frame_start == None: return
+        end = perf_counter()
+        self.add('frame', self.frame_start, end)
+        for name, seconds in self.phases.items():
+            if name not in self.times: self.times[name] = deque(maxlen=self.window)
+            self.times[name].append(seconds * 1000)
+        total = end - self.frame_start
+        if total > self.budget:
+            worst = max((n for n in self.phases if n != 'frame'), key=self.phases.get, default='frame')
+            self.hitches.append((self.frame, total * 1000, worst, self.phases.get(worst, total) * 1000))
+        self.frame += 1
+
+    def stats(self):
+        ''' Return dict of phase -> (p50 ms, p99 ms) over the rolling window '''
+        result = {}
+        for name, times in self.times.items():
+            times = sorted(times)
+            result[name] = (times[len(times)//2], times[min(len(times)-1, int(len(times)*0.99))])
+        return result
+
+    def draw_overlay(self, surface):
+        ''' Draw rolling p50/p99 per phase in the top left corner '''
+        if not (self.enabled and self.overlay): return
+        import pygame
+        if self.font == None: self.font = pygame.font.SysFont(None, 20)
+        lines = [f"{'phase':16} p50 ms  p99 ms"]
+        for name, (p50, p99) in sorted(self.stats().items()):
+            lines.append(f"{name:16} {p50:6.2f}  {p99:6.2f}")
+        if self.hitches:
+            frame, total, worst, ms = self.hitches[-1]
+            lines.append(f"hitch at frame {frame}: {total:.1f} ms, {worst} {ms:.1f} ms")
+        height = self.font.get_linesize()
+        surface.fill((0,0,0), (0, 0, 330, height * len(lines) + 4))
+        for i, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, (255,255,255)), (4, 2 + i * height))
+
+    def export_trace(self, path):
+        ''' Write recorded phases as Chrome trace event json (chrome://tracing) '''
+        with open(path, 'w') as file:
+            json.dump({'traceEvents':list(self.events), 'displayTimeUnit':'ms'}, file)
+
+    def report(self):
+        ''' Print the rolling stats and the recorded hitches '''
+        if not self.enabled: return
+        for name, (p50, p99) in sorted(self.stats().items()):
+            print(f"{name:24} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms")
+        for frame, total, worst, ms in self.hitches:
+            print(f"hitch at frame {frame}: {total:.1f} ms, slowest phase {worst} ({ms:.1f} ms)")
+
+frame_timer = Frame_timer(PROFILE_FRAMES)
@@ -0,0 +1,299 @@
+# functions and classes for drawing tilemaps
+from bisect import bisect_left, bisect_right
+import pygame
+
+CHUNK_SIZE = 8 # width and height of a chunk, in tiles
+
+class Render_queue(object):
+    ''' Collects the images drawn on a surface and draws them all with one 
+        Surface.blits call, which costs much less than a blit call per image.
+        It has the surface's blit, blits and get_clip, so anything with a 
+        draw(surface, ...) method can draw into it '''
+    def __init__(self, surface):
+        self.surface = surface
+        self.items = [] # (image, position) or (image, position, area) to draw
+
+    def blit(self, source, dest, area=None):
+        self.items.append((source, dest) if area == None else (source, dest, area))
+
+    def blits(self, blit_sequence, doreturn=False):
+        self.items.extend(blit_sequence)
+
+    def get_clip(self):
+        return self.surface.get_clip()
+
+    def flush(self):
+        ''' Draw everything queued, in the order it was queued '''
+        if self.items:
+            self.surface.blits(self.items, doreturn=False)
+            self.items = []
+
+class Tile_rows(object):
+    ''' Static tiles of a level with their positions worked out when the 
+        level loads, to draw the visible tiles one by one instead of from 
+        pre-rendered chunks. Drawing it into a Render_queue makes that cheap '''
+    def __init__(self, world_data, images, tile_size):
+        '''
+        args:
+            world_data: 2d list of tile ids
+            images: dict of tile id -> pygame image, tiles not in it aren't drawn
+            tile_size: width and height of a tile, in pixels
+        '''
+        self.tile_size = tile_size
+        self.cols = len(world_data[0])
+        self.rows = [] # (columns, list of (image, pixel x)) of each row's tiles
+        for row in world_data:
+            columns, tiles = [], []
+            for x, tile in enumerate(row):
+                img = images.get(tile)
+                if img != None:
+                    columns.append(x)
+                    tiles.append((img, x * tile_size))
+            self.rows.append((columns, tiles))
+
+    def draw(self, surface, scroll_x, scroll_y):
+        ''' Draw the tiles that overlap the viewport at (scroll_x, scroll_y), 
+            only inside the surface's clip area '''
+        clip = surface.get_clip()
+        left, top = scroll_x + clip.left, scroll_y + clip.top
+        size = self.tile_size
+        x0, x1 = max(0, left // size), min(self.cols - 1, (left + clip.width - 1) // size)
+        y0, y1 = max(0, top // size), min(len(self.rows) - 1, (top + clip.height - 1) // size)
+        items = []
+        for y in range(int(y0), int(y1) + 1):
+            columns, tiles = self.rows[y]
+            if not columns: continue
+            py = y * size - scroll_y
+            items += [(img, (px - scroll_x, py)) for img, px in \
+                tiles[bisect_left(columns, x0):bisect_right(columns, x1)]]
+        surface.blits(items, doreturn=False)
+
+class Chunk_cache(object):
+    ''' Static tiles of a level pre-rendered onto fixed-size chunk surfaces,
+        so a frame only blits the few chunks that overlap the screen '''
+    def __init__(self, world_data, images, tile_size, chunk_size=CHUNK_SIZE, bake=True):
+        '''
+        args:
+            world_data: 2d list of tile ids
+            images: dict of tile id -> pygame image, tiles not in it aren't drawn
+            tile_size: width and height of a tile, in pixels
+            chunk_size: width and height of a chunk, in tiles
+            bake: bake every chunk now, otherwise chunks are baked by 
+                bake_next or when they're first drawn
+        '''
+        self.world_data = world_data
+        self.images = images
+        self.tile_size = tile_size
+        self.chunk_size = chunk_size
+        self.chunk_px = chunk_size * tile_size
+        self.rows = len(world_data)
+        self.cols = len(world_data[0])
+        self.chunk_rows = -(-self.rows // chunk_size)
+        self.chunk_cols = -(-self.cols // chunk_size)
+        self.chunks = {} # (chunk x, chunk y) -> surface, None if chunk is empty
+        self.dirty = set() # chunks that need to be baked again before drawing
+        for cy in range(self.chunk_rows):
+            for cx in range(self.chunk_cols):
+                if bake: self.bake_chunk(cx, cy)
+                else: self.dirty.add((cx, cy))
+
+    def bake_chunk(self, cx, cy):
+        ''' Render the static tiles of chunk (cx, cy) onto its surface '''
+        surf = None
+        size = self.tile_size
+        x0, y0 = cx * self.chunk_size, cy * self.chunk_size
+        items = []
+        for y in range(y0, min(y0 + self.chunk_size, self.rows)):
+            row = self.world_data[y]
+            for x in range(x0, min(x0 + self.chunk_size, self.cols)):
+                img = self.images.get(row[x])
+                if img != None: items.append((img, ((x - x0) * size, (y - y0) * size)))
+        if items:
+            surf = pygame.Surface((self.chunk_px, self.chunk_px), pygame.SRCALPHA)
+            surf.blits(items, doreturn=False)
+        self.chunks[(cx, cy)] = surf
+        self.dirty.discard((cx, cy))
+
+    def bake_next(self, count=1):
+        ''' Bake up to count unbaked chunks, returns True if any are left '''
+        for _ in range(min(count, len(self.dirty))):
+            self.bake_chunk(*next(iter(self.dirty)))
+        return len(self.dirty) > 0
+
+    def set_tile(self, x, y, tile):
+        ''' Change a cell of world_data and invalidate the chunk containing it '''
+        if self.world_data[y][x] != tile:
+            self.world_data[y][x] = tile
+            self.dirty.add((x // self.chunk_size, y // self.chunk_size))
+
+    def draw(self, surface, scroll_x, scroll_y):
+        ''' Blit the chunks that overlap the viewport at (scroll_x, scroll_y), 
+            only inside the surface's clip area '''
+        clip = surface.get_clip()
+        left, top = scroll_x + clip.left, scroll_y + clip.top
+        px = self.chunk_px
+        cx0, cx1 = max(0, left // px), min(self.chunk_cols - 1, (left + clip.width - 1) // px)
+        cy0, cy1 = max(0, top // px), min(self.chunk_rows - 1, (top + clip.height - 1) // px)
+        items = []
+        for cy in range(int(cy0), int(cy1) + 1):
+            for cx in range(int(cx0), int(cx1) + 1):
+                if (cx, cy) in self.dirty: self.bake_chunk(cx, cy)
+                surf = self.chunks[(cx, cy)]
+                if surf != None: items.append((surf, (cx * px - scroll_x, cy * px - scroll_y)))
+        surface.blits(items, doreturn=False)
+
+class Dirty_rects(object):
+    ''' Finds the parts of the screen that changed since the last frame, 
+        assuming only the listed sprites can change while the background 
+        (level and camera position) stays the same '''
+    def __init__(self):
+        self.background = None # key of the background drawn last frame
+        self.sprites = {} # key -> screen rect and image drawn last frame
+
+    def update(self, background, sprites):
+        ''' Compare this frame to the last one and remember this frame
+        args:
+            background: hashable key for what's behind the sprites, eg. (scroll_x, scroll_y, level)
+            sprites: list of (key, image, screen position) drawn this frame
+        returns:
+            list of rects to redraw, or None if everything needs redrawing
+        '''
+        last = self.sprites
+        self.sprites = {}
+        for key, img, pos in sprites:
+            self.sprites[key] = (pygame.Rect(pos, img.get_size()), img)
+        if background != self.background:
+            self.background = background
+            return None
+        dirty = []
+        for key, (rect, img) in self.sprites.items():
+            old = last.pop(key, None)
+            if old == None:
+                dirty.append(rect)
+            elif old[0] != rect or old[1] is not img:
+                if old[0].colliderect(rect): dirty.append(old[0].union(rect))
+                else: dirty += [old[0], rect]
+        for rect, img in last.values(): # sprites that aren't drawn anymore
+            dirty.append(rect)
+        return dirty
+
+class Tile_layer(object):
+    ''' The tiles visible at one scroll position, drawn onto a surface the 
+        size of the view. It's only redrawn when the view scrolls, edited 
+        cells are patched in place '''
+    def __init__(self, size, images, tile_size, overlay=None):
+        '''
+        args:
+            size: (width, height) of the view in pixels
+            images: dict or list of tile id -> pygame image
+            tile_size: width and height of a tile, in pixels
+            overlay: drawn over the tiles (eg. Grid_overlay), needs a 
+                draw(surface, scroll_x, scroll_y, area=None) method
+        '''
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.images = images
+        self.tile_size = tile_size
+        self.overlay = overlay
+        self.encoded = False # surface is run-length encoded, see draw
+        self.world_data = None
+        self.scroll = None
+
+    def get_image(self, tile):
+        if tile < 0: return None
+        return self.images[tile]
+
+    def decode(self):
+        ''' Undo the run-length encoding before drawing on the surface, 
+            otherwise it's decoded and encoded again for every change '''
+        if self.encoded:
+            self.surface.set_alpha(255)
+            self.encoded = False
+
+    def redraw(self, world_data, scroll_x, scroll_y):
+        ''' Draw the visible cells of world_data at (scroll_x, scroll_y) '''
+        self.decode()
+        self.world_data = world_data
+        self.scroll = (scroll_x, scroll_y)
+        self.surface.fill((0,0,0,0))
+        size = self.tile_size
+        width, height = self.surface.get_size()
+        x0, x1 = max(0, scroll_x // size), min(len(world_data[0]) - 1, (scroll_x + width - 1) // size)
+        y0, y1 = max(0, scroll_y // size), min(len(world_data) - 1, (scroll_y + height - 1) // size)
+        items = []
+        for y in range(y0, y1 + 1):
+            row = world_data[y]
+            py = y * size - scroll_y
+            for x in range(x0, x1 + 1):
+                if row[x] >= 0: items.append((self.images[row[x]], (x * size - scroll_x, py)))
+        self.surface.blits(items, doreturn=False)
+        if self.overlay != None:
+            self.overlay.draw(self.surface, scroll_x, scroll_y)
+
+    def set_tile(self, x, y, tile):
+        ''' Redraw cell (x, y), call after changing it in world_data '''
+        if self.scroll == None: return
+        area = self.patch(x, y, tile)
+        if self.overlay != None:
+            self.overlay.draw(self.surface, self.scroll[0], self.scroll[1], area)
+
+    def set_tiles(self, x, y, n):
+        ''' Redraw cells x to x+n-1 of row y, call after changing them in 
+            world_data. Only the cells in view are drawn '''
+        if self.scroll == None: return
+        size = self.tile_size
+        width, height = self.surface.get_size()
+        if not -size < y * size - self.scroll[1] < height: return
+        first = max(x, self.scroll[0] // size)
+        last = min(x + n - 1, (self.scroll[0] + width - 1) // size)
+        if first > last: return
+        row = self.world_data[y]
+        for cx in range(first, last + 1):
+            area = self.patch(cx, y, row[cx])
+        if self.overlay != None:
+            area.union_ip(area.move((first - last) * size, 0))
+            self.overlay.draw(self.surface, self.scroll[0], self.scroll[1], area)
+
+    def patch(self, x, y, tile):
+        ''' Draw tile over cell (x, y) without the overlay, returns its rect '''
+        self.decode()
+        size = self.tile_size
+        area = pygame.Rect(x * size - self.scroll[0], y * size - self.scroll[1], size, size)
+        self.surface.fill((0,0,0,0), area)
+        img = self.get_image(tile)
+        if img != None: self.surface.blit(img, area)
+        return area
+
+    def draw(self, surface, world_data, scroll_x, scroll_y):
+        ''' Blit the visible tiles, redrawing them first if the view scrolled '''
+        if (scroll_x, scroll_y) != self.scroll or world_data is not self.world_data:
+            self.redraw(world_data, scroll_x, scroll_y)
+        elif not self.encoded:
+            # the view stopped moving, run-length encode the mostly empty 
+            # surface so blitting it is much faster. encoding isn't worth it 
+            # while scrolling since the surface changes every frame
+            self.surface.set_alpha(255, pygame.RLEACCEL)
+            self.encoded = True
+        surface.blit(self.surface, (0, 0))
+
+class Grid_overlay(object):
+    ''' Grid lines over a view of tiles, only the lines in view are drawn '''
+    def __init__(self, size, tile_size, color):
+        '''
+        args:
+            size: (width, height) of the area to draw the grid on
+        '''
+        self.size = size
+        self.tile_size = tile_size
+        self.color = color
+
+    def draw(self, surface, scroll_x, scroll_y, area=None):
+        ''' Draw the grid lines, only inside area if it's given '''
+        clip = surface.get_clip()
+        view = pygame.Rect((0, 0), self.size)
+        surface.set_clip(view if area == None else view.clip(area))
+        width, height = self.size
+        for x in range(-(scroll_x % self.tile_size), width, self.tile_size):
+            pygame.draw.line(surface, self.color, (x, 0), (x, height))
+        for y in range(-(scroll_y % self.tile_size), height, self.tile_size):
+            pygame.draw.line(surface, self.color, (0, y), (width, y))
+        surface.set_clip(clip)
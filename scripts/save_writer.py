@@ -0,0 +1,62 @@
+# writing save data on a background thread so saving never stalls a frame
+import json
+import threading
+import file_handling
+
+SAVE_DELAY = 0.5 # seconds to wait after a write, saves queued meanwhile are coalesced
+
+class Save_writer(object):
+    ''' Writes save data atomically on a worker thread. Only the newest
+        queued save is written, older ones it replaces are dropped '''
+    def __init__(self, name, enabled=True, delay=SAVE_DELAY):
+        '''
+        args:
+            name: json file to write (without .txt)
+            enabled: if False saves are ignored, eg. for headless runs
+            delay: seconds to wait after a write before the next one
+        '''
+        self.name = name
+        self.enabled = enabled
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.pending = None # json of the newest save not written yet
+        self.queued = threading.Event() # set when there's a save to write
+        self.closing = threading.Event()
+        self.thread = None # started by the first save
+        self.writes = 0 # number of saves written
+
+    def save(self, data):
+        ''' Queue a save of data. It's converted to json now, so changes to
+            data after this call aren't part of this save '''
+        if not self.enabled: return
+        text = json.dumps(data)
+        with self.lock:
+            self.pending = text
+        self.queued.set()
+        if self.thread == None:
+            self.thread = threading.Thread(target=self.run, name='save writer', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.queued.wait()
+            self.queued.clear()
+            with self.lock:
+                text, self.pending = self.pending, None
+            if text != None:
+                try:
+                    file_handling.write_atomic(self.name + '.txt', text.encode())
+                    self.writes += 1
+                except Exception as exc:
+                    print("ERROR: couldn't save game.", exc)
+            if self.closing.is_set() and not self.queued.is_set(): return
+            self.closing.wait(self.delay) # wakes early when closing
+
+    def close(self):
+        ''' Write the last queued save and stop the worker, blocks until done '''
+        if self.thread == None: return
+        self.closing.set()
+        self.queued.set()
+        self.thread.join()
+        self.thread = None
+        self.closing.clear()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Headless simulation of the game world: runs the same update as the main 
+# game loop for a fixed number of frames, as fast as possible, with no window
+# or frame limiting. Usage:
+#   python simulate.py --frames 3600 --seed 1
+#   python simulate.py --script "60:d,20:dw,60:a"
+#   python simulate.py --seed 1 --record run.rec  # record the input to a file
+#   python simulate.py --replay run.rec           # replay a recording as fast as possible
+
+import os
+import json
+import time
+import argparse
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import main # loads assets and the saved game
+import file_handling
+import inputs
+
+def simulate(frames, keys, data=None, start=None):
+    ''' Run the world for frames frames with input source keys
+    args:
+        frames: number of frames to simulate
+        keys: input source, anything with a get_pressed() like pygame.key
+        data: save data to start from, defaults to save_data.txt
+        start: (level, x, y) to start the player at instead of the saved position
+    returns:
+        dict of results
+    '''
+    if data == None: data = file_handling.load_json('save_data')
+    main.start_game(data, start)
+    levels = [main.level] # levels in the order they were visited
+    start = time.perf_counter()
+    for _ in range(frames):
+        main.update_world(keys)
+        if main.level != levels[-1]: levels.append(main.level)
+    elapsed = time.perf_counter() - start
+    return {
+        'frames': frames,
+        'seconds': elapsed,
+        'steps_per_sec': frames / elapsed if elapsed else float('inf'),
+        'player_pos': [main.player.rect.x, main.player.rect.y],
+        'level': main.level,
+        'levels_visited': levels,
+        'checkpoint': main.save_data['checkpoint'],
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the game world headless')
+    parser.add_argument('--frames', type=int, help='number of frames to simulate (default 3600, or the length of a replay)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for random input')
+    parser.add_argument('--script', help='scripted input like "30:d,10:dw,20:", overrides --seed')
+    parser.add_argument('--record', help='file to record the input to')
+    parser.add_argument('--replay', help='recording to replay, overrides --seed and --script')
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    args = parser.parse_args()
+
+    data = file_handling.load_json('save_data')
+    frames = args.frames or 3600
+    start = None
+    if args.replay:
+        keys = inputs.Replay_input(args.replay)
+        data, start = keys.save_data, keys.start
+        frames = args.frames or keys.frames
+    elif args.script: keys = inputs.Scripted_input.parse(args.script)
+    else: keys = inputs.Random_input(args.seed)
+    if args.record: keys = inputs.Recorder(keys, args.record, data, start=start)
+    results = simulate(frames, keys, data, start)
+    if args.record: keys.close()
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{results['frames']} frames in {results['seconds']:.3f}s ({results['steps_per_sec']:.0f} steps/s)")
+        print(f"player: {results['player_pos']}  level: {results['level']}  checkpoint: {results['checkpoint']}")
+        print(f"levels visited: {results['levels_visited']}")
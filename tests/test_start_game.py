@@ -0,0 +1,24 @@
+# restoring a save puts the player where it would respawn. run with:
+#   python -m pytest tests
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT) # the game loads its files relative to the repository
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'scripts')]
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import main # loads assets and the saved game headless
+
+def test_mid_level_save_spawns_at_checkpoint():
+    T = main.TILE_SIZE
+    checkpoint = [49 * T, 142 * T]
+    main.start_game({'level': 2, 'checkpoint': checkpoint, 'checkpoints_reached': [[2, 49, 142]], \
+        'player_loc': [184, 6508]})
+    assert main.level == 2
+    assert [main.player.rect.x, main.player.rect.y] == checkpoint
+
+def test_save_without_checkpoint_spawns_at_player_loc():
+    T = main.TILE_SIZE
+    main.start_game({'level': 0, 'checkpoint': 0, 'checkpoints_reached': [], 'player_loc': [5 * T, 140 * T]})
+    assert main.level == 0
+    assert [main.player.rect.x, main.player.rect.y] == [5 * T, 140 * T]